@@ -1,127 +1,108 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import math
 import ast
-import os
-
-def classify_bmi(bmi):
-    if bmi < 18.5:
-        return "Underweight"
-    elif 18.5 <= bmi < 24.9:
-        return "Normal"
-    elif 25 <= bmi < 29.9:
-        return "Overweight"
-    else:
-        return "Obese"
-
-def body_fat_category(gender, bf):
-    if gender == "Male":
-        if 2 <= bf <= 5:
-            return "Essential fat"
-        elif 6 <= bf <= 13:
-            return "Athletes"
-        elif 14 <= bf <= 17:
-            return "Fitness"
-        elif 18 <= bf <= 24:
-            return "Average"
-        elif bf >= 25:
-            return "Obese"
-        else:
-            return "Below essential fat"
-    else:
-        if 10 <= bf <= 13:
-            return "Essential fat"
-        elif 14 <= bf <= 20:
-            return "Athletes"
-        elif 21 <= bf <= 24:
-            return "Fitness"
-        elif 25 <= bf <= 31:
-            return "Average"
-        elif bf >= 32:
-            return "Obese"
-        else:
-            return "Below essential fat"
-
-def plot_bmi_category_bar(group, title, filename):
-    counts = group["BMI_Category"].value_counts(normalize=True) * 100
-    categories = ["Underweight", "Normal", "Overweight", "Obese"]
-    percentages = [counts.get(cat, 0) for cat in categories]
-
-    fig, ax = plt.subplots()
-    bars = ax.bar(categories, percentages, color=['#5DADE2', '#58D68D', '#F4D03F', '#E74C3C'])
-    ax.set_ylabel('Percentage (%)')
-    ax.set_ylim(0, 100)
-    ax.set_title(title)
-    ax.bar_label(bars, fmt='%.1f%%')
-
-    plot_path = os.path.join("static", "charts", filename)
-    plt.tight_layout()
-    plt.savefig(plot_path)
-    plt.close()
-    return f"charts/{filename}"
-
-def perform_health_analysis(user_data_path, user_info):
-    df = pd.read_csv(user_data_path)
-    df = pd.concat([df, pd.DataFrame([user_info])], ignore_index=True)
-
-    df["Height_m"] = df["Height"] / 100
-    df["BMI"] = df["Weight"] / (df["Height_m"] ** 2)
-    df["BMI_Category"] = df["BMI"].apply(classify_bmi)
-
-    age = user_info["Age"]
-    gender = user_info["Gender"]
-    conditions = ast.literal_eval(user_info["Conditions"])
-
-    age_group = df[df["Age"] == age]
-    gender_group = df[df["Gender"] == gender]
-
-    def shares_condition(cond_str):
-        try:
-            cond_list = ast.literal_eval(cond_str)
-        except Exception:
-            return False
-        return len(set(cond_list) & set(conditions)) > 0
-
-    condition_group = df[df["Conditions"].apply(shares_condition)]
-
-    os.makedirs(os.path.join("static", "charts"), exist_ok=True)
-
-    plot1 = plot_bmi_category_bar(age_group, f"BMI by Age {age}", "age_group_plot.png")
-    plot2 = plot_bmi_category_bar(gender_group, f"BMI by Gender: {gender}", "gender_group_plot.png")
-    plot3 = plot_bmi_category_bar(condition_group, "BMI by Similar Conditions", "condition_group_plot.png")
-
-    # TDEE / BMR / Body Fat
-    weight = user_info["Weight"]
-    height = user_info["Height"]
-    age = user_info["Age"]
-    gender = user_info["Gender"]
-
-    # Get measurements dynamically, fallback to defaults if missing
-    waist = user_info.get("Waist", 85)
-    neck = user_info.get("Neck", 38)
-    hip = user_info.get("Hip", 100)
-
-    # Convert to proper numeric types
-    weight = float(user_info["Weight"])
-    height = float(user_info["Height"])
-    age = int(user_info["Age"])
-
-    waist = float(user_info.get("Waist", 85))
-    neck = float(user_info.get("Neck", 38))
-    hip = float(user_info.get("Hip", 100))
-
-
-    bmi = weight / ((height / 100) ** 2)
-    if gender == "Male":
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-        body_fat = 86.010 * math.log10(waist - neck) - 70.041 * math.log10(height) + 36.76
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-        body_fat = 163.205 * math.log10(waist + hip - neck) - 97.684 * math.log10(height) + 78.387
-
-    tdee = bmr * 1.375  # activity_level fixed here
-
-    bf_cat = body_fat_category(gender, body_fat)
+import numpy as np
+import pandas as pd
+import body_metrics
+from body_metrics import compute_metrics, ordinal
+from cohort_sketches import get_cohort_sketches, cohort_keys
+from neighbours import get_neighbour_index
+from render import get_renderer, BMI_CATEGORIES
+from chart_cache import get_chart_cache, chart_key
+from tracing import stage
+
+def bmi_category_job(bmi_values, title):
+    labels = body_metrics.bmi_category(bmi_values)
+    n = len(labels)
+    percentages = [float(np.count_nonzero(labels == cat) / n * 100) if n else 0.0 for cat in BMI_CATEGORIES]
+    return "bmi_bar", {"percentages": percentages, "title": title}
+
+def plot_bmi_category_bars(groups):
+    """Render ``[(bmi_values, title), ...]`` as BMI bar charts; returns chart cache names."""
+    cache = get_chart_cache()
+    jobs = [bmi_category_job(bmi_values, title) for bmi_values, title in groups]
+    names = [chart_key("bmi", "cohort", data) for kind, data in jobs]
+
+    # Charts seen before are served from the cache; the rest render in parallel
+    missing = [i for i, name in enumerate(names) if not cache.lookup(name)]
+    images = get_renderer().render_many([jobs[i] for i in missing])
+    for i, (image, timings) in zip(missing, images):
+        cache.store(names[i], image)
+    return names
+
+PERCENTILE_METRICS = {"BMI": "BMI", "Weight": "weight", "BMR": "BMR"}
+
+def cohort_label(kind, value):
+    if kind == "age":
+        return f"users aged {value}"
+    if kind == "gender":
+        return f"{value.lower()} users"
+    if kind == "condition":
+        return f"users with {value}"
+    return "all users"
+
+def perform_health_analysis(store, user_info, conditions=None):
+    """Compare one user with the cohort in ``store`` (a ``cohort_store.CohortStore``).
+
+    The user is added to every comparison group they belong to; their own
+    stored row, if they signed up, is left out so they are not counted twice.
+    The third chart shows the users most like them (``neighbours``).
+    """
+    if conditions is None:
+        conditions = ast.literal_eval(user_info["Conditions"])
+    with stage("user_metrics"):
+        user = compute_metrics(pd.DataFrame([user_info])).iloc[0]
+
+    with stage("cohort_metrics"):
+        # Cohort columns straight from the memory-mapped store
+        keep = ~store.registered_user(user_info["ID"]) if user_info.get("ID") is not None else slice(None)
+        weight = store.column("Weight")[keep]
+        height = store.column("Height")[keep]
+        ages = store.column("Age")[keep]
+        cohort_bmi = body_metrics.bmi(weight, height)
+
+        age = user_info["Age"]
+        gender = user_info["Gender"]
+        user_bits = store.condition_mask(conditions)
+
+        # One comparison of a column per group; the user row is appended to each
+        groups = {
+            "age": ages == age,
+            "gender": store.gender_is(gender)[keep],
+        }
+        bmi_values = {}
+        for name, mask in groups.items():
+            bmi_values[name] = np.concatenate([cohort_bmi[mask], [user["BMI"]]])
+
+    with stage("neighbours"):
+        rows = get_neighbour_index(store).query(float(age), float(user_info["Height"]), float(user_info["Weight"]),
+                                                gender, user_bits, exclude_id=user_info.get("ID"))
+        neighbour_bmi = body_metrics.bmi(store.column("Weight")[rows], store.column("Height")[rows])
+        bmi_values["neighbours"] = np.concatenate([neighbour_bmi, [user["BMI"]]])
+
+    plot1, plot2, plot3 = plot_bmi_category_bars([
+        (bmi_values["age"], f"BMI by Age {age}"),
+        (bmi_values["gender"], f"BMI by Gender: {gender}"),
+        (bmi_values["neighbours"], f"BMI of the {len(rows)} Users Most Like You"),
+    ])
+
+    # Where the user sits within each cohort, read from the quantile sketches
+    with stage("cohort_percentiles"):
+        sketches = get_cohort_sketches(store)
+        values = {"BMI": user["BMI"], "Weight": float(user_info["Weight"]), "BMR": user["BMR"]}
+        percentiles = []
+        for kind, value in cohort_keys(age, gender, conditions):
+            ranks = []
+            for metric, name in PERCENTILE_METRICS.items():
+                rank = sketches.percentile((kind, value), metric, values[metric])
+                if rank is not None:
+                    ranks.append(f"{name} {ordinal(rank)}")
+            if ranks:
+                percentiles.append(f"Among {cohort_label(kind, value)}: {', '.join(ranks)} percentile")
+
+    bmi = user["BMI"]
+    bmr = user["BMR"]
+    tdee = user["TDEE"]
+    body_fat = user["Body_Fat"]
+    bf_cat = user["Body_Fat_Category"]
 
     if bmi < 18.5:
         cal_advice = f"Underweight: Gain weight by consuming {tdee + 250:.0f} to {tdee + 500:.0f} kcal/day."
@@ -147,7 +128,8 @@ def perform_health_analysis(user_data_path, user_info):
         "TDEE": f"{tdee:.2f} kcal/day",
         "Body Fat %": f"{body_fat:.2f}%",
         "Body Fat Category": bf_cat,
-        "Calorie Advice": cal_advice
+        "Calorie Advice": cal_advice,
+        "Percentiles": percentiles
     }
 
     return plot1, plot2, plot3, text_summary
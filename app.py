@@ -1,139 +1,79 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+import startup  # first, so the startup time covers every other import
+from flask import Flask, Request, render_template, request, redirect, url_for, session, jsonify, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
+import io
 import os
-import pandas as pd
-import ast
-from rapidfuzz import process
-import easyocr 
-from werkzeug.utils import secure_filename
-from analyse import perform_health_analysis
+import sys
+import hashlib
+import jobs
+import tracing
+from tracing import stage
+from scanner import cached_scan, scan_and_cache, loaded_scan_cache
+from image_store import ImageStore, UPLOAD_KEEP, content_hash, image_type
+import ingredient_db
+from profiles import Profile, get_profiles
+from chart_cache import get_chart_cache, chart_key, CHART_MAX_AGE
+
+# Analysis, charting and USDA modules (pandas, matplotlib, requests) are imported
+# by the routes that use them, so a worker serving /login boots without them.
+# Set WARMUP (see startup.py) to load them before the first request instead.
 
+base_dir = os.path.abspath(os.path.dirname(__file__))
 
-from nutrition import (
-    get_food_nutrients_in_grams,
-    get_dietary_warnings,
-    plot_nutrient_pie_chart_grams
-)
+profiles = get_profiles()
 
+UPLOAD_LIMIT_MB = float(os.getenv("UPLOAD_LIMIT_MB", "16"))  # largest request body, enforced while it streams in
 
-base_dir = os.path.abspath(os.path.dirname(__file__))
-user_data_path = os.path.join(base_dir, 'user_data', 'user_data.csv')
-ingredient_data_path = os.path.join(base_dir, 'updated_ingredients_conditions', 'updated_ingredients_conditions.csv')
-demo_user_data_path = os.path.join(base_dir, 'user_data', 'demo_user_data.csv')
-
-ud = pd.read_csv(user_data_path)
-fic = pd.read_csv(ingredient_data_path, index_col=0)
-
-class Person:
-    def __init__(self, name, id, age, password, conditions, gender, weight, height):
-        self.name = name
-        self.id = id
-        self.age = age
-        self.password = password
-        self.conditions = conditions
-        self.gender = gender
-        self.weight = float(weight)  # assuming weight in kg
-        self.height = float(height)  # assuming height in cm
-        self.bmi = self.calculate_bmi()
-        self.bmi_category = self.get_bmi_category()
-
-    def calculate_bmi(self):
-        height_m = self.height / 100  # convert cm to meters
-        bmi = self.weight / (height_m ** 2)
-        return round(bmi, 2)
-
-    def get_bmi_category(self):
-        bmi = self.bmi
-        if bmi < 18.5:
-            return "Underweight"
-        elif 18.5 <= bmi < 25:
-            return "Normal weight"
-        elif 25 <= bmi < 30:
-            return "Overweight"
-        else:
-            return "Obese"
-
-    def add_to_csv(self):
-        global ud
-        atc = {
-            "Username": self.name,
-            "ID": self.id,
-            "Age": self.age,
-            "Password": self.password,
-            # Save conditions as a proper list string for correct parsing later
-           "Conditions": str(self.conditions), 
-            "Gender": self.gender,
-            "Weight": self.weight,
-            "Height": self.height
-        }
-        ud = pd.concat([ud, pd.DataFrame([atc])], ignore_index=True)
-        ud.to_csv(user_data_path, index=False)
-
-    def search_img(self,img):       
-        raw_lines = []
-        result = easyocr.Reader(["en"]).readtext(img)
-        for (bbox,text,prob) in result:
-            if prob >= 0.5:
-                raw_lines.append(text)
-
-        text_block = " ".join(raw_lines)
-        text = text_block.lower()
-        text = text.replace("(", " ").replace(")", " ")
-        text = ''.join([c if c.isalpha() or c.isspace() else ' ' for c in text])
-
-        words = text.split()
-
-        def get_phrases(words, max_n=3):
-            return [' '.join(words[i:i+n]) for n in range(1, max_n+1) for i in range(len(words)-n+1)]
-
-        phrases = set(get_phrases(words))
-
-        df = pd.read_csv(ingredient_data_path)
-
-        ingredients= df["Food Ingredients"].str.lower().tolist()
-
-        matched = [p for p in phrases if p in ingredients]
-        unmatched = [p for p in phrases if p not in ingredients]
-
-        fuzzy_matches = []
-        fuzzy_selected = set()
-        for item in unmatched:
-            match, score, index = process.extractOne(item, ingredients)
-            if score >= 89: 
-                fuzzy_matches.append((item, match, score))
-                fuzzy_selected.add(match)
-        all_matched = list(set(matched) | fuzzy_selected)
-
-        result_tuple = self.checkeffect(all_matched)
-        return result_tuple
-
-
-    def checkeffect(self, matchedlist):
-        effects = set()
-        bad_ingredients = []
-        for i in self.conditions:
-            for j in matchedlist:
-                i = str(i).title()
-                j = str(j).capitalize()
-                try:
-                    value = fic.loc[j, i]
-                except KeyError:
-                    continue
-
-                if value.lower() == 'bad':
-                    bad_ingredients.append(j)
-                effects.add(value.lower())
-        unique_bad_ingredients = set(bad_ingredients)  # removes duplicates, order not guaranteed
-        bad_list_str = "\n- " + "\n- ".join(unique_bad_ingredients)
-        if "bad" in effects:
-            return "Warning: This food contains ingredients that may not be suitable for your health conditions. Please consult a health professional before consuming. \nHarmful ingredients are:" + bad_list_str,bad_ingredients
-        elif 'good' in effects:
-            return "This food looks safe and beneficial based on your selected health conditions.", bad_ingredients
-        else:
-            return "This food is mostly safe, but contains some neutral ingredients. You may consume it in moderation.", bad_ingredients
+
+class InMemoryRequest(Request):
+    # Bodies are capped by MAX_CONTENT_LENGTH, so uploaded files stay in memory
+    # instead of being spooled to a temporary file
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 
 app = Flask(__name__)
+app.request_class = InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = int(UPLOAD_LIMIT_MB * 1024 * 1024)
 app.secret_key = 'your_very_secret_key_here'  # <-- Change to a secure key
+tracing.install(app)
+startup.install(app)
+
+
+def cache_stats():
+    # Only subsystems already in use are reported; a scrape never loads one
+    stats = {
+        "chart": get_chart_cache().stats(),
+        "profile": profiles.stats(),
+    }
+    if loaded_scan_cache() is not None:
+        stats["scan"] = loaded_scan_cache().stats()
+    if ingredient_db.get_ingredient_db().loaded:
+        stats["fuzzy_resolution"] = ingredient_db.current().index.resolved.stats()
+    if "nutrition" in sys.modules:
+        from nutrition import USDA_API_KEY
+        from usda import get_client
+        client = get_client(USDA_API_KEY)
+        stats["usda_memory"] = client.memory.stats()
+        if client.disk is not None:
+            stats["usda_disk"] = client.disk.stats()
+    return stats
+
+@tracing.collected("app_cache_hits_total", "Cache hits.", "counter", ["cache"])
+def cache_hits():
+    return {(name,): s["hits"] for name, s in cache_stats().items()}
+
+@tracing.collected("app_cache_misses_total", "Cache misses.", "counter", ["cache"])
+def cache_misses():
+    return {(name,): s["misses"] for name, s in cache_stats().items()}
+
+@tracing.collected("app_ocr_queue_depth", "Scan jobs queued or running in this worker.")
+def ocr_queue_depth():
+    return {(): jobs.get_queue().depth()}
+
+@tracing.collected("app_ingredient_table_loads_total", "Ingredient table versions loaded.", "counter")
+def ingredient_table_loads():
+    return {(): ingredient_db.get_ingredient_db().reloads}
 
 @app.route('/')
 def start():
@@ -151,13 +91,9 @@ def login():
         id = int(request.form['id'])  # Convert to int
         password = request.form['password']
     
-        if id in ud.index and name == ud.at[id, 'Username'] and password == str(ud.at[id, 'Password']):
-            conditions = ast.literal_eval(ud.at[id, 'Conditions'])
-            gender = ud.at[id, 'Gender']
-            weight = ud.at[id, 'Weight']
-            height = ud.at[id, 'Height']
+        person = profiles.get(id)
+        if person is not None and name == person.name and password == str(person.password):
             session['user_id'] = id  # Store in session
-            person = Person(name, id, ud.at[id, 'Age'], password, conditions, gender, weight, height)
             return redirect(url_for('home', source='login'))
         else:
             return render_template('login.html', error_message="Invalid input")
@@ -166,7 +102,7 @@ def login():
 
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
-    conditions_list = fic.columns.tolist()[3:]
+    conditions_list = ingredient_db.current().conditions
     if request.method == 'POST':
         name = request.form['name']
         age = request.form['age']
@@ -175,39 +111,43 @@ def signup():
         weight = request.form['weight']
         height = request.form['height']
         raw_conditions = request.form.getlist('conditions')
-        conditions = [c.strip() for cond in raw_conditions for c in cond.split(',')]
-
-        id = len(ud)
-        person = Person(name, id, age, password, conditions, gender, weight, height)
-        person.add_to_csv()
+        conditions = [c.strip() for cond in raw_conditions for c in cond.split(',') if c.strip()]
+        unknown = [c for c in conditions if c not in conditions_list]
+        if unknown:
+            # Only the table's conditions are accepted; anything else would fill the cohort store's vocabulary
+            return render_template('signup.html', conditions=conditions_list,
+                                   error_message=f"Unknown conditions: {', '.join(unknown)}"), 400
+
+        from plots import record_signup
+        person = profiles.add(Profile(name, None, age, password, conditions, gender, weight, height))
+        id = person.id
+        try:
+            record_signup(person)
+        except Exception:
+            profiles.remove(id)  # no account without its cohort row
+            raise
         session['user_id'] = id  # Store in session
         return redirect(url_for('home', source='signup'))
 
     return render_template('signup.html', conditions=conditions_list)
 
-from plots import generate_home_plots  # Add this import
-import ast
-
 @app.route('/home')
 def home():
     user_id = session.get('user_id')
-    if not user_id:
+    person = profiles.get(user_id) if user_id is not None else None
+    if person is None:
         return redirect(url_for('login'))
 
-    user_row = ud.loc[user_id]
-    age = user_row['Age']
-    gender = user_row['Gender']
-    weight = user_row['Weight']
+    age = person.age
+    gender = person.gender
+    weight = person.weight
+    height = person.height
 
     # Prepare user info for profile card (excluding password & conditions)
-    user_info = user_row.to_dict()
+    user_info = person.record()
     user_info.pop("Password", None)
-
-    # Convert string list of conditions to a Python list, then to a set
-    user_conditions = ast.literal_eval(user_row['Conditions'])
-    user_conditions = set(user_conditions)
-
     user_info.pop("Conditions", None)
+    user_conditions = set(person.conditions)
 
     # Handle source messages
     source = request.args.get('source', '')
@@ -217,7 +157,8 @@ def home():
     elif source == 'signup':
         success_message = "Account Created Successfully!"
     # Get plots and warnings — pass user_conditions to highlight bars properly
-    plot_data = generate_home_plots(age, gender, weight, user_conditions)
+    from plots import generate_home_plots
+    plot_data = generate_home_plots(age, gender, weight, height, user_conditions, user_id=person.id)
     plots = [img_base64 for img_base64, _ in plot_data]
     warnings = [msg or "" for _, msg in plot_data]
 
@@ -236,8 +177,12 @@ def home():
 
 
 UPLOAD_FOLDER = os.path.join(base_dir, 'uploaded_images')
-ALLOWED_EXTENSIONS = {'jpg', 'jpeg'} 
+ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+image_store = ImageStore(UPLOAD_FOLDER)
+
+RESULT_WAIT = 2   # seconds /result blocks on a running scan before falling back to polling
+RESULT_POLL = 2   # refresh interval of the "please wait" page
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -253,38 +198,110 @@ def upload_image():
         if file.filename == '':
             return render_template('uploadimage.html', message="No selected file")
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            return redirect(url_for('result', filename=filename))
+        data = file.read() if file and allowed_file(file.filename) else b""
+        ext = image_type(data)
+        if ext is not None:
+            # The scan works on the bytes in memory; keeping the original is a side effect
+            if UPLOAD_KEEP:
+                digest, _ = image_store.put_later(data, ext)
+            else:
+                digest = content_hash(data)
+
+            # A label we have scanned before skips OCR entirely
+            if cached_scan(digest) is None:
+                try:
+                    jobs.get_queue().submit(scan_and_cache, data, digest, job_id=digest)
+                except jobs.QueueFull as e:
+                    return render_template('uploadimage.html', message="The scanner is busy right now. Please try again in a few seconds."), 503, {'Retry-After': str(e.retry_after)}
+
+            return redirect(url_for('result', scan=digest))
         else:
             return render_template('uploadimage.html', message="Invalid file type. Please upload a valid image.")
     
     return render_template('uploadimage.html', message="Upload an image to analyze.")
 
+@app.errorhandler(RequestEntityTooLarge)
+def too_large(e):
+    if request.endpoint == 'upload_image':
+        return render_template('uploadimage.html', message=f"The image is too large (at most {UPLOAD_LIMIT_MB:g} MB)."), 413
+    return e
+
 @app.route('/result')
 def result():
     user_id = session.get('user_id')
     if user_id is None:
         return redirect(url_for('login'))  # redirect if not logged in
 
-    filename = request.args.get('filename')
-    if not filename:
+    digest = request.args.get('scan')
+    if not digest:
         return "No image uploaded", 400
 
-    row = ud.loc[user_id]
-    conditions = ast.literal_eval(row['Conditions'])
-    person = Person(row['Username'], user_id, row['Age'], row['Password'], conditions,
-                    row['Gender'], row['Weight'], row['Height'])
-    
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    result_tuple = person.search_img(filepath)
+    with stage("scan_cache"):
+        outcome = cached_scan(digest)
+    if outcome is not None:
+        state = jobs.DONE
+    else:
+        with stage("scan_wait"):
+            state, outcome = jobs.get_queue().status(digest, wait=RESULT_WAIT)
+    if state == jobs.PENDING:
+        # Page refreshes itself until the scan is finished
+        return render_template('result.html', result="Analysing your image, please wait...", pending=True, poll_seconds=RESULT_POLL)
+    if state == jobs.UNKNOWN:
+        return "Unknown or expired scan, please upload the image again", 404
+    if state != jobs.DONE:
+        return render_template('result.html', result="Sorry, we could not read this image. Please try again with a clearer picture."), 500
+
+    person = profiles.get(user_id)
+    if person is None:
+        return redirect(url_for('login'))
+
+    with stage("verdict"):
+        result_tuple = person.checkeffect(outcome)
     result, bad_ingredients = result_tuple
 
     return render_template('result.html', result=result)
 
+API_MAX_PRODUCTS = 5000   # per /api/verdicts request
+API_MAX_USERS = 1000
+
+def _is_str_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+@app.route('/api/verdicts', methods=['POST'])
+def api_verdicts():
+    # {"products": [{"id": ..., "ingredients": [...] or "text"}],
+    #  "users": [{"id": ..., "conditions": [...]} or {"id": <registered user id>}]}
+    payload = request.get_json(silent=True) or {}
+    products = payload.get('products')
+    users = payload.get('users')
+    if not isinstance(products, list) or not isinstance(users, list):
+        return jsonify(error="Expected JSON with 'products' and 'users' lists"), 400
+    if len(products) > API_MAX_PRODUCTS or len(users) > API_MAX_USERS:
+        return jsonify(error=f"At most {API_MAX_PRODUCTS} products and {API_MAX_USERS} users per request"), 413
+
+    condition_sets = []
+    for user in users:
+        if not isinstance(user, dict):
+            return jsonify(error="Each user must be an object"), 400
+        if 'conditions' in user:
+            if not _is_str_list(user['conditions']):
+                return jsonify(error=f"User {user.get('id')!r}: 'conditions' must be a list of strings"), 400
+            condition_sets.append({"id": user.get('id'), "conditions": user['conditions']})
+        else:
+            person = profiles.get(user.get('id')) if isinstance(user.get('id'), int) else None
+            if person is None:
+                return jsonify(error=f"Unknown user {user.get('id')!r}"), 400
+            condition_sets.append({"id": user['id'], "conditions": list(person.conditions)})
+    for product in products:
+        if not isinstance(product, dict):
+            return jsonify(error="Each product must be an object"), 400
+        ingredients = product.get('ingredients')
+        if ingredients is not None and not isinstance(ingredients, str) and not _is_str_list(ingredients):
+            return jsonify(error=f"Product {product.get('id')!r}: 'ingredients' must be a string or a list of strings"), 400
+
+    from batch import score_products
+    return jsonify(results=score_products(products, condition_sets))
+
 @app.route('/about')
 def about():
     return render_template('about.html')
@@ -299,21 +316,18 @@ def searchfood():
     ingredients = []
 
     if request.method == 'POST':
+        from nutrition import lookup_food, get_dietary_warnings, plot_nutrient_pie_chart_grams
         food_name = request.form['food_name']
-        result = get_food_nutrients_in_grams(food_name)
+        food = lookup_food(food_name)
 
-        if result:
-            nutrients, description, ingredients = result
+        if food:
+            nutrients, description, ingredients = food['nutrients'], food['description'], food['ingredients']
 
-            # Generate pie chart
-            chart_filename = f"{food_name.replace(' ', '_')}_chart.png"
-            chart_folder = os.path.join('static', 'charts')
-            os.makedirs(chart_folder, exist_ok=True)
+            # Pie chart is only drawn the first time this food/nutrient set is seen
+            chart_name = chart_key("pie", food['fdc_id'], [description, nutrients])
+            chart_path = get_chart_cache().get_or_render(
+                chart_name, lambda path: plot_nutrient_pie_chart_grams(nutrients, description, path))
 
-            chart_path = os.path.join(chart_folder, chart_filename)
-            plot_nutrient_pie_chart_grams(nutrients, description, chart_path)
-
-            chart_path = f"charts/{chart_filename}"
             warnings = get_dietary_warnings(nutrients)
         else:
             no_data = True
@@ -339,6 +353,63 @@ def searchfood():
         ingredients=ingredients
     )
 
+@app.route('/api/foods/suggest')
+def api_food_suggest():
+    # ?q=whole mi -> {"suggestions": [{"fdc_id": ..., "description": ...}]}; empty without a local food index
+    from food_index import get_food_index, SUGGEST_LIMIT
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', SUGGEST_LIMIT, type=int), 20)
+    index = get_food_index()
+    if index is None or len(query) < 2 or limit < 1:
+        return jsonify(suggestions=[])
+    with stage("food_suggest"):
+        return jsonify(suggestions=index.suggest(query, limit))
+
+@app.route('/charts/<path:filename>')
+def chart(filename):
+    # Names are content hashes: let browsers and proxies cache them for good
+    response = send_from_directory(get_chart_cache().folder, filename, max_age=CHART_MAX_AGE,
+                                   etag=os.path.splitext(os.path.basename(filename))[0])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route('/searchmeal', methods=['GET', 'POST'])
+def searchmeal():
+    if request.method == 'GET':
+        return redirect(url_for('searchfood'))
+
+    from nutrition import analyse_meal, plot_nutrient_pie_chart_grams
+    meal = request.form['meal']
+    result = analyse_meal(meal)
+    chart_path = None
+    warnings = []
+    meal_items = []
+    missing = []
+
+    if result:
+        meal_items = result['items']
+        missing = result['missing']
+        warnings = result['warnings']
+
+        ids = "-".join(str(item['fdc_id']) for item in meal_items)
+        chart_name = chart_key("meal", hashlib.sha1(ids.encode()).hexdigest()[:12], result['nutrients'])
+        chart_path = get_chart_cache().get_or_render(
+            chart_name, lambda path: plot_nutrient_pie_chart_grams(result['nutrients'], "your meal", path))
+
+    return render_template(
+        'searchfood.html',
+        food_name=meal,
+        description="",
+        warnings=warnings,
+        chart_path=chart_path,
+        no_data=not result,
+        ingredients=[],
+        meal_items=meal_items,
+        missing=missing
+    )
+
 
 @app.route('/analysehealth', methods=['GET', 'POST'])
 def analysehealth():
@@ -346,18 +417,11 @@ def analysehealth():
     if user_id is None:
         return redirect(url_for('login'))
 
-    row = ud.loc[user_id]
+    person = profiles.get(user_id)
+    if person is None:
+        return redirect(url_for('login'))
     # Base user info without measurements
-    user_info = {
-        "Username": row['Username'],
-        "ID": user_id,
-        "Age": row['Age'],
-        "Password": row['Password'],
-        "Conditions": row['Conditions'],
-        "Gender": row['Gender'],
-        "Weight": row['Weight'],
-        "Height": row['Height']
-    }
+    user_info = person.record()
 
     if request.method == 'POST':
         # Get measurements from submitted form, convert to float or fallback to None
@@ -382,7 +446,9 @@ def analysehealth():
         if hip:
             user_info["Hip"] = hip
 
-        plot1, plot2, plot3, metrics = perform_health_analysis(demo_user_data_path, user_info)
+        from analyse import perform_health_analysis
+        from cohort_store import get_cohort_store
+        plot1, plot2, plot3, metrics = perform_health_analysis(get_cohort_store(), user_info, person.conditions)
 
         return render_template(
             'analysehealth.html',
@@ -420,8 +486,10 @@ def analysehealth():
 
 
 
-
 
 
 if __name__ == '__main__':
+    from werkzeug.serving import is_running_from_reloader
+    if is_running_from_reloader():  # the serving process, not the reloader watching it
+        startup.finish()
     app.run(debug=True)
@@ -0,0 +1,78 @@
+import sys
+import json
+from scanner import match_ingredient_lists
+from verdicts import describe
+import ingredient_db
+
+BATCH_CHUNK = 2000  # products matched per fuzzy-matching batch
+
+
+def verdict_label(has_bad, has_good):
+    if has_bad:
+        return "bad"
+    elif has_good:
+        return "good"
+    return "neutral"
+
+
+def score_products(products, users, snapshot=None):
+    """Ingredient verdicts for many products x many users in one call.
+
+    ``products`` are dicts with an ``id`` and ``ingredients`` (a list of
+    ingredient strings or one free-text string). ``users`` are dicts with an
+    ``id`` and a ``conditions`` list. Returns one dict per product with the
+    matched ingredients and a verdict per user, using the same matching and
+    ``checkeffect`` rules as a label scan, against one ingredient table
+    version (``snapshot``, the current one by default).
+    """
+    snapshot = snapshot or ingredient_db.current()
+    table = snapshot.table
+    users = list(users)
+    masks = table.condition_masks([u.get("conditions") or [] for u in users])
+    user_ids = [u.get("id") for u in users]
+
+    results = []
+    products = list(products)
+    for start in range(0, len(products), BATCH_CHUNK):
+        chunk = products[start:start + BATCH_CHUNK]
+        matched_lists = match_ingredient_lists([p.get("ingredients") or [] for p in chunk], snapshot.index)
+        for product, matched in zip(chunk, matched_lists):
+            has_bad, has_good, bad, names = table.evaluate_many(masks, matched)
+            verdicts = []
+            for i, user_id in enumerate(user_ids):
+                bad_ingredients = [name for name, is_bad in zip(names, bad[i]) if is_bad]
+                verdicts.append({
+                    "user": user_id,
+                    "verdict": verdict_label(has_bad[i], has_good[i]),
+                    "message": describe(has_bad[i], has_good[i], bad_ingredients),
+                    "bad_ingredients": bad_ingredients,
+                })
+            results.append({"id": product.get("id"), "ingredients": matched, "verdicts": verdicts})
+    return results
+
+
+if __name__ == "__main__":
+    # python batch.py products.jsonl users.json > verdicts.jsonl
+    if len(sys.argv) != 3:
+        print("usage: python batch.py PRODUCTS.jsonl USERS.json", file=sys.stderr)
+        sys.exit(2)
+
+    with open(sys.argv[2]) as f:
+        users = json.load(f)
+
+    def read_products(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    chunk = []
+    for product in read_products(sys.argv[1]):
+        chunk.append(product)
+        if len(chunk) == BATCH_CHUNK:
+            for row in score_products(chunk, users):
+                print(json.dumps(row))
+            chunk = []
+    if chunk:
+        for row in score_products(chunk, users):
+            print(json.dumps(row))
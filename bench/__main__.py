@@ -0,0 +1,247 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import itertools
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKDIR = os.path.join(base_dir, 'cache', 'bench')
+DEFAULT_RESULTS_DIR = os.path.join(base_dir, 'bench', 'results')
+
+
+def bench_matching(ctx):
+    from scanner import match_ingredients
+    import ingredient_db
+    index = ingredient_db.current().index
+    labels = itertools.cycle(ctx["labels"])
+    results = [ctx["measure"]("match_label", lambda: match_ingredients(next(labels), index), labels=len(ctx["labels"]))]
+
+    def cold():
+        index.resolved.clear()  # every phrase goes through the fuzzy matcher again
+        match_ingredients(next(labels), index)
+    results.append(ctx["measure"]("match_label_cold", cold, labels=len(ctx["labels"])))
+    return results
+
+
+def bench_ocr(ctx):
+    if not ctx["ocr"]:
+        return []
+    from bench import synth
+    from scanner import read_label
+    images = []
+    for i, lines in enumerate(ctx["labels"][:5]):
+        path = os.path.join(ctx["workdir"], f"label-{i}.jpg")
+        synth.render_label(lines, path)
+        images.append(path)
+    paths = itertools.cycle(images)
+    return [ctx["measure"]("ocr_label", lambda: read_label(next(paths)), repeat=3, images=len(images))]
+
+
+def bench_checkeffect(ctx):
+    from scanner import match_ingredients
+    from profiles import Profile
+    import ingredient_db
+    matched = itertools.cycle([match_ingredients(lines) for lines in ctx["labels"]])
+    conditions = ingredient_db.current().table.conditions
+    results = []
+    for n_conditions in (1, 5, len(conditions)):
+        person = Profile("bench", 0, 40, "", conditions[:n_conditions], "Male", 80, 180)
+        results.append(ctx["measure"]("checkeffect", lambda: person.checkeffect(next(matched)), conditions=n_conditions))
+    return results
+
+
+def _sample_user(store):
+    i = len(store) // 2
+    gender = store.genders[store.column("Gender")[i]]
+    return {
+        "Username": "bench", "ID": None, "Password": "",
+        "Age": int(store.column("Age")[i]), "Gender": gender,
+        "Weight": float(store.column("Weight")[i]), "Height": float(store.column("Height")[i]),
+        "Conditions": str(store.condition_names(store.column("Conditions")[i])),
+    }
+
+
+def bench_home_plots(ctx):
+    from cohort import CohortStats
+    from plots import generate_home_plots
+    results = []
+    for size, store in ctx["cohorts"].items():
+        t0 = time.perf_counter()
+        stats = CohortStats.from_store(store)
+        build_ms = (time.perf_counter() - t0) * 1000
+        user = _sample_user(store)
+        conditions = set(store.condition_names(store.column("Conditions")[len(store) // 2]))
+        result = ctx["measure"]("generate_home_plots", lambda: generate_home_plots(
+            user["Age"], user["Gender"], user["Weight"], user["Height"], conditions, stats=stats, store=store),
+            repeat=5, users=size)
+        result["stats_build_ms"] = build_ms
+        results.append(result)
+    return results
+
+
+def bench_neighbours(ctx):
+    from neighbours import get_neighbour_index
+    results = []
+    for size, store in ctx["cohorts"].items():
+        t0 = time.perf_counter()
+        index = get_neighbour_index(store)
+        build_ms = (time.perf_counter() - t0) * 1000
+        user = _sample_user(store)
+        bits = store.column("Conditions")[len(store) // 2]
+        result = ctx["measure"]("neighbours", lambda: index.query(
+            user["Age"], user["Height"], user["Weight"], user["Gender"], bits), users=size)
+        result["build_ms"] = build_ms
+        results.append(result)
+    return results
+
+
+def bench_health_analysis(ctx):
+    from analyse import perform_health_analysis
+    results = []
+    for size, store in ctx["cohorts"].items():
+        user = _sample_user(store)
+        results.append(ctx["measure"]("perform_health_analysis",
+                                      lambda: perform_health_analysis(store, user), repeat=5, users=size))
+    return results
+
+
+def bench_dietary_warnings(ctx):
+    from nutrition import get_dietary_warnings, nutrients_in_grams
+    foods = []
+    for path in sorted(glob.glob(os.path.join(base_dir, 'fixtures', 'usda', 'food', '*.json'))):
+        with open(path) as f:
+            foods.append(nutrients_in_grams(json.load(f)))
+    if not foods:
+        return []
+    nutrients = itertools.cycle(foods)
+    return [ctx["measure"]("get_dietary_warnings", lambda: get_dietary_warnings(next(nutrients)), foods=len(foods))]
+
+
+def bench_render(ctx):
+    from render import render_chart
+    jobs = {
+        "bmi_bar": {"percentages": [5.0, 45.0, 35.0, 15.0], "title": "BMI by Age 30"},
+        "condition_barh": {"labels": [f"Condition {i}" for i in range(12)], "values": [float(i * 3) for i in range(12)],
+                           "highlight": ["Condition 3"], "title": "Conditions for Users with Age = 30"},
+        "nutrient_pie": {"labels": ["Water", "Protein", "Fat", "Carbohydrate", "Other"],
+                         "sizes": [60.0, 12.0, 10.0, 15.0, 3.0], "title": "Nutrient Composition of bench"},
+    }
+    return [ctx["measure"]("render_chart", lambda kind=kind, data=data: render_chart(kind, data), repeat=5, kind=kind)
+            for kind, data in jobs.items()]
+
+
+BENCHMARKS = {
+    "matching": bench_matching,
+    "ocr": bench_ocr,
+    "checkeffect": bench_checkeffect,
+    "home_plots": bench_home_plots,
+    "neighbours": bench_neighbours,
+    "health_analysis": bench_health_analysis,
+    "dietary_warnings": bench_dietary_warnings,
+    "render": bench_render,
+}
+
+
+def run(args):
+    from bench import synth
+    from bench.harness import measure, environment, save
+
+    os.makedirs(args.workdir, exist_ok=True)
+    only = set(args.only.split(",")) if args.only else set(BENCHMARKS)
+    unknown = only - set(BENCHMARKS)
+    if unknown:
+        sys.exit(f"Unknown benchmarks: {', '.join(sorted(unknown))} (choose from {', '.join(BENCHMARKS)})")
+
+    cohorts = {}
+    if only & {"home_plots", "neighbours", "health_analysis"}:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            t0 = time.perf_counter()
+            cohorts[size] = synth.build_cohort(os.path.join(args.workdir, f"cohort-{size}"), size, seed=args.seed)
+            print(f"cohort of {size} users ready in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+    def measure_with_defaults(name, fn, repeat=args.repeat, **params):
+        return measure(name, fn, repeat=repeat, **params)
+
+    ctx = {
+        "labels": synth.generate_labels(args.labels, seed=args.seed),
+        "cohorts": cohorts,
+        "workdir": args.workdir,
+        "ocr": args.ocr,
+        "measure": measure_with_defaults,
+    }
+    results = []
+    for name, bench in BENCHMARKS.items():
+        if name not in only:
+            continue
+        for result in bench(ctx):
+            params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+            print(f"{result['name']:<24} {params:<22} {result['median_ms']:10.3f} ms  "
+                  f"±{result['iqr_ms']:.3f}  peak {result['peak_alloc_kb']:.0f} KiB", file=sys.stderr)
+            results.append(result)
+
+    env = environment()
+    out = args.out or os.path.join(DEFAULT_RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{env['commit'] or 'nogit'}.json")
+    save(out, results, env)
+    print(out)
+
+
+def compare_runs(args):
+    from bench.harness import load, compare
+    old, new = load(args.old), load(args.new)
+    print(f"{old['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    for name, params, before, after, ratio, flag in compare(old, new, args.threshold):
+        params = ", ".join(f"{k}={v}" for k, v in params.items())
+        print(f"{name:<24} {params:<22} {before:10.3f} -> {after:10.3f} ms  x{ratio:.2f}  {flag}")
+
+
+def write_labels(args):
+    from bench import synth
+    os.makedirs(args.out, exist_ok=True)
+    for i, lines in enumerate(synth.generate_labels(args.count, seed=args.seed)):
+        with open(os.path.join(args.out, f"label-{i}.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        synth.render_label(lines, os.path.join(args.out, f"label-{i}.jpg"))
+    print(f"Wrote {args.count} labels to {args.out}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Microbenchmarks of the app's hot paths")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("run", help="run benchmarks and save the results as JSON (default)")
+    p.add_argument("--only", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    p.add_argument("--sizes", default="1000,100000", help="synthetic cohort sizes (default 1000,100000; up to 10M)")
+    p.add_argument("--labels", type=int, default=200, help="synthetic ingredient labels to match")
+    p.add_argument("--repeat", type=int, default=7, help="timing samples per benchmark")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--ocr", action="store_true", help="also OCR rendered labels (needs easyocr)")
+    p.add_argument("--workdir", default=DEFAULT_WORKDIR, help="where synthetic cohorts and charts are kept")
+    p.add_argument("--out", help="result file (default bench/results/<time>-<commit>.json)")
+    p.set_defaults(func=run)
+
+    p = sub.add_parser("compare", help="compare two result files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.10, help="relative change worth flagging")
+    p.set_defaults(func=compare_runs)
+
+    p = sub.add_parser("labels", help="write synthetic label text and images")
+    p.add_argument("out")
+    p.add_argument("--count", type=int, default=20)
+    p.add_argument("--seed", type=int, default=0)
+    p.set_defaults(func=write_labels)
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0].startswith("-"):
+        argv = ["run"] + list(argv)
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        # keep benchmark charts out of the app's chart cache
+        os.environ.setdefault("CHART_CACHE_DIR", os.path.join(args.workdir, "charts"))
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
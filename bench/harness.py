@@ -0,0 +1,129 @@
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+import tracemalloc
+import numpy as np
+
+MIN_SAMPLE_SECONDS = 0.05  # calls are batched until one timing sample takes at least this long
+
+
+def _calls_per_sample(fn, min_time):
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or number >= 1_000_000:
+            return number
+        number *= 10 if elapsed < min_time / 10 else 2
+
+
+def measure(name, fn, repeat=7, warmup=1, min_time=MIN_SAMPLE_SECONDS, **params):
+    """Time ``fn()`` and report per-call statistics in milliseconds.
+
+    After ``warmup`` calls the number of calls per sample is calibrated so
+    one sample takes at least ``min_time``; ``repeat`` samples are taken with
+    the garbage collector off. A final traced call reports the peak Python
+    allocation of one call.
+    """
+    for _ in range(warmup):
+        fn()
+    number = _calls_per_sample(fn, min_time)
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - t0) / number * 1000)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    samples = np.array(samples)
+    q1, median, q3 = np.percentile(samples, [25, 50, 75])
+    return {
+        "name": name,
+        "params": params,
+        "calls_per_sample": number,
+        "repeat": repeat,
+        "median_ms": float(median),
+        "iqr_ms": float(q3 - q1),
+        "min_ms": float(samples.min()),
+        "max_ms": float(samples.max()),
+        "peak_alloc_kb": peak / 1024,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def save(path, results, env=None):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": env or environment(), "max_rss_mb": max_rss_mb(), "results": results}, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(old, new, threshold=0.10):
+    """Rows ``(name, params, old ms, new ms, ratio, flag)`` for benchmarks present in both runs.
+
+    ``flag`` is "slower"/"faster" when the medians differ by more than
+    ``threshold`` and that difference is larger than both runs' IQR.
+    """
+    old_results = {_key(r): r for r in old["results"]}
+    rows = []
+    for result in new["results"]:
+        before = old_results.get(_key(result))
+        if before is None:
+            continue
+        ratio = result["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        noise = max(result["iqr_ms"], before["iqr_ms"])
+        flag = ""
+        if abs(result["median_ms"] - before["median_ms"]) > noise and abs(ratio - 1) > threshold:
+            flag = "slower" if ratio > 1 else "faster"
+        rows.append((result["name"], result["params"], before["median_ms"], result["median_ms"], ratio, flag))
+    return rows
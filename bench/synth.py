@@ -0,0 +1,145 @@
+import os
+import ast
+import json
+import numpy as np
+import pandas as pd
+import cohort_store
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+demo_user_data_path = os.path.join(base_dir, 'user_data', 'demo_user_data.csv')
+ingredient_data_path = os.path.join(base_dir, 'updated_ingredients_conditions', 'updated_ingredients_conditions.csv')
+
+CHUNK = 1_000_000  # users generated and written per step
+
+# Used when the demo cohort is not available
+DEFAULT_CONDITIONS = {
+    "High Blood Pressure": 0.30, "Diabetes": 0.12, "Obesity": 0.20, "Heart Disease": 0.07,
+    "Cholesterol Imbalances": 0.18, "Asthma": 0.08, "Acid Reflux": 0.15, "Food Allergies": 0.08,
+    "Migraine": 0.10, "IBS": 0.09, "Lactose Intolerance": 0.12, "Celiac Disease": 0.01,
+    "Chronic Kidney Disease": 0.04, "Gout": 0.03, "Anemia": 0.05, "Skin Conditions": 0.06,
+    "Gallstones": 0.03, "Osteoporosis": 0.05, "Thyroid Disorders": 0.06,
+}
+
+
+def condition_mix(path=demo_user_data_path):
+    """Per-condition prevalence, taken from the demo cohort when it exists."""
+    if not os.path.exists(path):
+        return dict(DEFAULT_CONDITIONS)
+    lists = pd.read_csv(path)["Conditions"].map(ast.literal_eval)
+    counts = lists.explode().value_counts()
+    return {str(name): float(n / len(lists)) for name, n in counts.items()}
+
+
+def generate_columns(n, mix, start_id=0, rng=None):
+    """``n`` users as cohort-store column arrays.
+
+    Age, height and weight follow rough adult distributions (weight tied to
+    height through BMI); conditions are drawn independently per user with
+    the probabilities in ``mix``, in the order of its keys.
+    """
+    rng = rng or np.random.default_rng(0)
+    gender = rng.integers(0, 2, n, dtype=np.uint8)  # 0 = Male, 1 = Female
+    height = np.where(gender == 0, rng.normal(176, 7, n), rng.normal(163, 6.5, n)).clip(140, 210).round()
+    bmi = rng.lognormal(np.log(25), 0.17, n).clip(15, 50)
+    weight = (bmi * (height / 100) ** 2).round()
+    age = rng.triangular(18, 35, 90, n).astype(np.int16)
+
+    bits = np.zeros(n, dtype=np.uint32)
+    for i, p in enumerate(mix.values()):
+        bits |= (rng.random(n) < p).astype(np.uint32) << np.uint32(i)
+
+    return {
+        "ID": np.arange(start_id, start_id + n, dtype=np.int64),
+        "Age": age,
+        "Gender": gender,
+        "Weight": weight,
+        "Height": height,
+        "Conditions": bits,
+        "Registered": np.zeros(n, dtype=np.uint8),
+    }
+
+
+def build_cohort(folder, n, seed=0, mix=None):
+    """A cohort store of ``n`` synthetic users in ``folder``, reused if it already matches."""
+    mix = mix or condition_mix()
+    spec = {"n": n, "seed": seed, "conditions": mix}
+    spec_path = os.path.join(folder, "synthetic.json")
+    if os.path.exists(spec_path):
+        with open(spec_path) as f:
+            if json.load(f) == spec:
+                return cohort_store.CohortStore(folder)
+
+    rng = np.random.default_rng(seed)
+    cohort_store.create_store(folder, genders=["Male", "Female"], conditions=list(mix))
+    for start in range(0, n, CHUNK):
+        cohort_store.append_columns(folder, generate_columns(min(CHUNK, n - start), mix, start, rng))
+    with open(spec_path, "w") as f:
+        json.dump(spec, f)
+    return cohort_store.CohortStore(folder)
+
+
+def ingredient_names(path=ingredient_data_path):
+    return [str(name) for name in pd.read_csv(path)["Food Ingredients"].dropna()]
+
+
+def _typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = int(rng.integers(1, len(word) - 1))
+    kind = rng.integers(0, 3)
+    if kind == 0:
+        return word[:i] + word[i + 1:]  # dropped letter
+    if kind == 1:
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]  # swapped letters
+    return word[:i] + "il"[int(rng.integers(0, 2))] + word[i + 1:]  # OCR confusion
+
+
+NOISE = ["contains", "less than", "of", "and/or", "for color", "may contain", "traces of", "2%", "natural flavor"]
+
+
+def generate_label(names, rng, n_ingredients=20, typo_rate=0.1, line_width=40):
+    """OCR-like lines of an ingredient panel: mixed case, typos, sub-lists and noise words."""
+    picks = rng.choice(len(names), size=min(n_ingredients, len(names)), replace=False)
+    items = []
+    for i in picks:
+        words = [_typo(w, rng) if rng.random() < typo_rate else w for w in names[i].split()]
+        item = " ".join(words)
+        item = item.upper() if rng.random() < 0.5 else item.lower()
+        if rng.random() < 0.1:
+            item += " (" + NOISE[int(rng.integers(0, len(NOISE)))] + ")"
+        items.append(item)
+    text = "INGREDIENTS: " + ", ".join(items) + "."
+
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > line_width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    if line:
+        lines.append(line)
+    return lines
+
+
+def generate_labels(count, seed=0, **kwargs):
+    rng = np.random.default_rng(seed)
+    names = ingredient_names()
+    return [generate_label(names, rng, **kwargs) for _ in range(count)]
+
+
+def render_label(lines, path=None, width=900):
+    """Draw label lines as a black-on-white JPEG for end-to-end OCR runs; returns the PIL image."""
+    from PIL import Image, ImageDraw, ImageFont
+    try:
+        font = ImageFont.load_default(size=28)
+    except TypeError:  # Pillow < 10.1
+        font = ImageFont.load_default()
+    line_height = 40
+    image = Image.new("RGB", (width, line_height * len(lines) + 40), "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((20, 20 + i * line_height), line, fill="black", font=font)
+    if path:
+        image.save(path, quality=90)
+    return image
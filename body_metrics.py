@@ -0,0 +1,111 @@
+import sys
+import numpy as np
+import pandas as pd
+
+ACTIVITY_FACTOR = 1.375  # lightly active
+DEFAULT_WAIST = 85
+DEFAULT_NECK = 38
+DEFAULT_HIP = 100
+
+
+def bmi(weight, height_cm):
+    height_m = np.asarray(height_cm, dtype=float) / 100
+    return np.asarray(weight, dtype=float) / height_m ** 2
+
+
+def bmi_category(bmi_values):
+    # The bands keep their historical gaps: 24.9 <= BMI < 25 falls through to "Obese"
+    b = np.asarray(bmi_values, dtype=float)
+    return np.select(
+        [b < 18.5, (18.5 <= b) & (b < 24.9), (25 <= b) & (b < 29.9)],
+        ["Underweight", "Normal", "Overweight"],
+        default="Obese",
+    )
+
+
+def bmr(weight, height_cm, age, is_male):
+    # Mifflin-St Jeor
+    base = 10 * np.asarray(weight, dtype=float) + 6.25 * np.asarray(height_cm, dtype=float) - 5 * np.asarray(age, dtype=float)
+    return np.where(is_male, base + 5, base - 161)
+
+
+def tdee(bmr_values, activity=ACTIVITY_FACTOR):
+    return np.asarray(bmr_values, dtype=float) * activity
+
+
+def body_fat(is_male, height_cm, waist=DEFAULT_WAIST, neck=DEFAULT_NECK, hip=DEFAULT_HIP):
+    # US Navy method; NaN where the tape measurements give a non-positive log argument
+    height = np.asarray(height_cm, dtype=float)
+    waist = np.asarray(waist, dtype=float)
+    neck = np.asarray(neck, dtype=float)
+    hip = np.asarray(hip, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        male = 86.010 * np.log10(waist - neck) - 70.041 * np.log10(height) + 36.76
+        female = 163.205 * np.log10(waist + hip - neck) - 97.684 * np.log10(height) + 78.387
+    return np.where(is_male, male, female)
+
+
+def body_fat_category(is_male, bf):
+    # The bands keep their historical gaps: values between them fall through to the default
+    bf = np.asarray(bf, dtype=float)
+    is_male = np.broadcast_to(np.asarray(is_male, dtype=bool), bf.shape)
+    male = np.select(
+        [(2 <= bf) & (bf <= 5), (6 <= bf) & (bf <= 13), (14 <= bf) & (bf <= 17), (18 <= bf) & (bf <= 24), bf >= 25],
+        ["Essential fat", "Athletes", "Fitness", "Average", "Obese"],
+        default="Below essential fat",
+    )
+    female = np.select(
+        [(10 <= bf) & (bf <= 13), (14 <= bf) & (bf <= 20), (21 <= bf) & (bf <= 24), (25 <= bf) & (bf <= 31), bf >= 32],
+        ["Essential fat", "Athletes", "Fitness", "Average", "Obese"],
+        default="Below essential fat",
+    )
+    return np.where(is_male, male, female)
+
+
+def _measurement(df, column, default):
+    if column in df:
+        return pd.to_numeric(df[column], errors="coerce").fillna(default).to_numpy(dtype=float)
+    return np.full(len(df), default, dtype=float)
+
+
+def compute_metrics(df):
+    """BMI, BMR, TDEE and body fat for every row of a user table at once.
+
+    ``df`` needs ``Weight`` (kg), ``Height`` (cm), ``Age`` and ``Gender``;
+    optional ``Waist``/``Neck``/``Hip`` columns (cm) fall back to the same
+    defaults as the single-user analysis.
+    """
+    weight = pd.to_numeric(df["Weight"]).to_numpy(dtype=float)
+    height = pd.to_numeric(df["Height"]).to_numpy(dtype=float)
+    age = pd.to_numeric(df["Age"]).to_numpy(dtype=float)
+    is_male = (df["Gender"] == "Male").to_numpy()
+
+    bmi_values = bmi(weight, height)
+    bmr_values = bmr(weight, height, age, is_male)
+    bf = body_fat(is_male, height, _measurement(df, "Waist", DEFAULT_WAIST),
+                  _measurement(df, "Neck", DEFAULT_NECK), _measurement(df, "Hip", DEFAULT_HIP))
+    return pd.DataFrame({
+        "BMI": bmi_values,
+        "BMI_Category": bmi_category(bmi_values),
+        "BMR": bmr_values,
+        "TDEE": tdee(bmr_values),
+        "Body_Fat": bf,
+        "Body_Fat_Category": body_fat_category(is_male, bf),
+    }, index=df.index)
+
+
+def ordinal(n):
+    n = int(round(n))
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+if __name__ == "__main__":
+    # Bulk re-scoring: python body_metrics.py user_data/demo_user_data.csv metrics.csv
+    if len(sys.argv) != 3:
+        print("usage: python body_metrics.py USERS.csv OUT.csv", file=sys.stderr)
+        sys.exit(2)
+    users = pd.read_csv(sys.argv[1])
+    out = pd.concat([users[["ID"]], compute_metrics(users)], axis=1)
+    out.to_csv(sys.argv[2], index=False)
+    print(f"Scored {len(out)} users")
@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import threading
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", os.path.join(base_dir, 'cache', 'charts'))
+CHART_CACHE_MAX_MB = float(os.getenv("CHART_CACHE_MAX_MB", "200"))
+CHART_MAX_AGE = 365 * 86400  # chart names are content hashes, so browsers may keep them for good
+EVICT_EVERY = 50  # renders between eviction sweeps
+
+
+def chart_key(kind, ident, data):
+    """File name for a chart of ``kind`` about ``ident`` (e.g. an fdcId) drawn from ``data``."""
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:20]
+    ident = "".join(c if c.isalnum() else "_" for c in str(ident))[:40]
+    return f"{kind}-{ident}-{digest}.png"
+
+
+class ChartCache:
+    """Rendered chart images kept on disk under content-derived names.
+
+    A chart is only drawn when no file with its name exists yet; least
+    recently used files are removed once the folder exceeds ``max_bytes``.
+    """
+
+    def __init__(self, folder=CHART_CACHE_DIR, max_bytes=CHART_CACHE_MAX_MB * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._renders = 0
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def lookup(self, name):
+        """``name`` if that chart is already on disk (marking it recently used), else ``None``."""
+        path = self.path(name)
+        if os.path.exists(path):
+            os.utime(path)
+            self.hits += 1
+            return name
+        self.misses += 1
+        return None
+
+    def get_or_render(self, name, render):
+        """Return ``name`` once the chart exists, calling ``render(path)`` if needed.
+
+        ``render`` writes the image to the path it is given. Returns ``None``
+        when it produced no file (e.g. nothing to plot).
+        """
+        return self.lookup(name) or self._write(name, render)
+
+    def store(self, name, image):
+        """Save already rendered ``image`` bytes under ``name``."""
+        def write(path):
+            with open(path, "wb") as f:
+                f.write(image)
+        return self._write(name, write)
+
+    def _write(self, name, render):
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(name)
+        # draw into a private file so concurrent requests never see half a PNG
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+        try:
+            render(tmp_path)
+            if not os.path.exists(tmp_path):
+                return None
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._rendered()
+        return name
+
+    def _rendered(self):
+        with self._lock:
+            self._renders += 1
+            sweep = self._renders % EVICT_EVERY == 1
+        if sweep:
+            self.evict()
+
+    def evict(self):
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(".tmp.png"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_chart_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ChartCache()
+    return _cache
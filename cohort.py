@@ -0,0 +1,87 @@
+import threading
+from collections import Counter
+import numpy as np
+
+DIMENSIONS = ("age", "gender")
+
+
+def age_key(age):
+    return int(age)
+
+
+def gender_key(gender):
+    return str(gender).lower()
+
+
+KEY_FUNCS = {"age": age_key, "gender": gender_key}
+
+
+class CohortStats:
+    """Condition counts per age and per gender.
+
+    Follows a ``cohort_store.CohortStore`` by row count like the quantile
+    sketches: ``sync`` folds in the rows appended since the last call, by
+    this worker or any other, so a home page lookup is a dictionary access
+    regardless of how many users there are. Conditions are multi-hot in the
+    store, so a condition listed twice for one user counts once.
+    """
+
+    def __init__(self, store_id=None):
+        self.store_id = store_id
+        self.rows = 0  # store rows folded in
+        self.groups = {dim: {} for dim in DIMENSIONS}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_store(cls, store):
+        """Counts for every row of ``store`` so far."""
+        stats = cls(store.meta.get("id"))
+        stats.sync(store)
+        return stats
+
+    def _ingest(self, store, start, stop):
+        gender_keys = np.array([gender_key(g) for g in store.genders] or [""], dtype=object)
+        keys = {
+            "age": store.column("Age")[start:stop].astype(np.int64),
+            "gender": gender_keys[store.column("Gender")[start:stop]],
+        }
+        bits = store.column("Conditions")[start:stop]
+        has = [(name, (bits >> np.uint32(i) & 1).astype(bool)) for i, name in enumerate(store.conditions)]
+
+        for dim in DIMENSIONS:
+            values, inverse = np.unique(keys[dim], return_inverse=True)
+            inverse = inverse.reshape(-1)
+            counts = np.bincount(inverse, minlength=len(values))
+            groups = [self.groups[dim].setdefault(value.item() if hasattr(value, "item") else value, [0, Counter()])
+                      for value in values]
+            for group, n in zip(groups, counts.tolist()):
+                group[0] += n
+            for name, mask in has:
+                per_group = np.bincount(inverse[mask], minlength=len(values))
+                for i in np.flatnonzero(per_group):
+                    groups[i][1][name] += int(per_group[i])
+
+    def sync(self, store):
+        """Fold in rows appended to ``store``; returns the number of new rows."""
+        rows = len(store)
+        if rows <= self.rows:
+            return 0
+        with self._lock:
+            start = self.rows
+            if rows <= start:  # another thread got here first
+                return 0
+            self._ingest(store, start, rows)
+            self.rows = rows
+            return rows - start
+
+    def covers(self, store):
+        """Whether these counts describe a prefix of ``store``."""
+        return self.store_id == store.meta.get("id") and self.rows <= len(store)
+
+    def prevalence(self, dim, value):
+        """``(users in the cohort, {condition: count})`` for one cohort."""
+        with self._lock:
+            group = self.groups[dim].get(KEY_FUNCS[dim](value))
+            if group is None:
+                return 0, {}
+            return group[0], dict(group[1])
@@ -0,0 +1,178 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+import body_metrics
+from quantiles import KLLSketch
+
+AGE_BAND_YEARS = 10    # age cohorts are bands like "30-39"
+MIN_COHORT = 10        # smaller cohorts report no percentiles
+SAVE_EVERY_ROWS = 1000  # rows ingested between saves of the sketch file
+INGEST_CHUNK = 1_000_000
+METRICS = ("BMI", "Weight", "BMR")
+SKETCH_FILE = "sketches.npz"  # kept next to the cohort store's columns
+
+logger = logging.getLogger(__name__)
+
+
+def age_band(age):
+    low = int(age) // AGE_BAND_YEARS * AGE_BAND_YEARS
+    return f"{low}-{low + AGE_BAND_YEARS - 1}"
+
+
+def cohort_keys(age, gender, conditions):
+    """Cohorts a user belongs to, as ``(kind, value)`` pairs."""
+    return [("all", ""), ("age", age_band(age)), ("gender", str(gender))] + \
+        [("condition", str(name)) for name in conditions]
+
+
+def column_metrics(weight, height, age, is_male):
+    """The sketched metrics for arrays of users. Body fat is left out: the
+    cohort has no tape measurements to compare a user's own against."""
+    return {
+        "BMI": body_metrics.bmi(weight, height),
+        "Weight": np.asarray(weight, dtype=float),
+        "BMR": body_metrics.bmr(weight, height, age, is_male),
+    }
+
+
+class CohortSketches:
+    """Quantile sketches of BMI, weight and BMR per cohort.
+
+    Cohorts are everyone, each age band, each gender and each condition.
+    The sketches follow a ``cohort_store.CohortStore`` by row count: ``sync``
+    folds in the rows appended since the last call, so a signup costs O(1)
+    in every worker however large the cohort is. The sketch file is only a
+    head start; rows it does not cover are read from the store.
+    """
+
+    def __init__(self, store_id=None, conditions=()):
+        self.store_id = store_id
+        self.conditions = list(conditions)  # store vocabulary seen so far
+        self.rows = 0                       # store rows folded in
+        self.sketches = {}                  # (kind, value) -> {metric: KLLSketch}
+        self._saved_rows = 0
+        self._lock = threading.Lock()
+
+    def _sketch(self, key, metric):
+        group = self.sketches.get(key)
+        if group is None:
+            group = self.sketches[key] = {name: KLLSketch() for name in METRICS}
+        return group[metric]
+
+    def _ingest(self, store, start, stop):
+        weight = store.column("Weight")[start:stop]
+        height = store.column("Height")[start:stop]
+        ages = store.column("Age")[start:stop]
+        genders = store.column("Gender")[start:stop]
+        bits = store.column("Conditions")[start:stop]
+        male = store.genders.index("Male") if "Male" in store.genders else -1
+        metrics = column_metrics(weight, height, ages, genders == male)
+
+        masks = [(("all", ""), slice(None))]
+        bands = np.asarray(ages, dtype=np.int64) // AGE_BAND_YEARS * AGE_BAND_YEARS
+        for low in np.unique(bands).tolist():
+            masks.append((("age", age_band(low)), bands == low))
+        for code in np.unique(genders).tolist():
+            masks.append((("gender", store.genders[code]), genders == code))
+        for i, name in enumerate(store.conditions):
+            has = (bits >> np.uint32(i) & 1).astype(bool)
+            if has.any():
+                masks.append((("condition", name), has))
+
+        for key, mask in masks:
+            for metric, values in metrics.items():
+                self._sketch(key, metric).extend(values[mask])
+
+    def sync(self, store):
+        """Fold in rows appended to ``store``; returns the number of new rows."""
+        rows = len(store)
+        if rows <= self.rows:
+            return 0
+        with self._lock:
+            start = self.rows
+            for chunk in range(start, rows, INGEST_CHUNK):
+                self._ingest(store, chunk, min(rows, chunk + INGEST_CHUNK))
+            self.rows = max(rows, start)
+            self.conditions = list(store.conditions)
+            if self.rows - self._saved_rows >= SAVE_EVERY_ROWS:
+                self._save_locked(os.path.join(store.folder, SKETCH_FILE))
+            return self.rows - start
+
+    def covers(self, store):
+        """Whether these sketches describe a prefix of ``store``."""
+        return (self.store_id == store.meta.get("id") and self.rows <= len(store)
+                and store.conditions[:len(self.conditions)] == self.conditions)
+
+    def percentile(self, key, metric, value):
+        """Percentage of cohort ``key`` below ``value``, or ``None`` for a small or unknown cohort."""
+        group = self.sketches.get(key)
+        if group is None or len(group[metric]) < MIN_COHORT or value != value:  # NaN: no measurement
+            return None
+        with self._lock:  # a query flushes the sketch's update buffer
+            rank = group[metric].rank(value)
+        return None if rank is None else rank * 100
+
+    def _save_locked(self, path):
+        keys = list(self.sketches)
+        header = {"store_id": self.store_id, "rows": self.rows, "conditions": self.conditions,
+                  "keys": keys, "metrics": list(METRICS)}
+        arrays = {}
+        for i, key in enumerate(keys):
+            for metric in METRICS:
+                for h, level in enumerate(self.sketches[key][metric].to_arrays()):
+                    arrays[f"{i}/{metric}/{h}"] = level
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, header=np.array(json.dumps(header)), **arrays)
+        os.replace(tmp, path)
+        self._saved_rows = self.rows
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(str(data["header"]))
+            sketches = cls(header["store_id"], header["conditions"])
+            sketches.rows = sketches._saved_rows = header["rows"]
+            levels = {}
+            for name in data.files:
+                if name != "header":
+                    i, metric, h = name.split("/")
+                    levels.setdefault((int(i), metric), {})[int(h)] = data[name]
+        for i, key in enumerate(header["keys"]):
+            group = sketches.sketches[tuple(key)] = {}
+            for metric in header["metrics"]:
+                arrays = levels[(i, metric)]
+                group[metric] = KLLSketch.from_arrays([arrays[h] for h in sorted(arrays)])
+        return sketches
+
+
+_sketches = {}  # store folder -> CohortSketches
+_sketches_lock = threading.Lock()
+
+
+def get_cohort_sketches(store):
+    """Sketches of ``store``, loaded from its sketch file or built from its
+    columns on first use, and brought up to date with its row count."""
+    store.refresh()
+    sketches = _sketches.get(store.folder)
+    if sketches is None or not sketches.covers(store):  # first use, or the store was rebuilt
+        with _sketches_lock:
+            sketches = _sketches.get(store.folder)
+            if sketches is None or not sketches.covers(store):
+                sketches = _sketches[store.folder] = _load_or_build(store)
+    sketches.sync(store)
+    return sketches
+
+
+def _load_or_build(store):
+    path = os.path.join(store.folder, SKETCH_FILE)
+    if os.path.exists(path):
+        try:
+            sketches = CohortSketches.load(path)
+            if sketches.covers(store):
+                return sketches
+            logger.info("Sketch file %s does not match the cohort store, rebuilding", path)
+        except (OSError, ValueError, KeyError):
+            logger.exception("Could not read sketch file %s, rebuilding", path)
+    return CohortSketches(store.meta.get("id"), store.conditions)
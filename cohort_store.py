@@ -0,0 +1,257 @@
+import os
+import sys
+import ast
+import json
+import uuid
+import fcntl
+import threading
+import numpy as np
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+demo_user_data_path = os.path.join(base_dir, 'user_data', 'demo_user_data.csv')
+COHORT_STORE_DIR = os.getenv("COHORT_STORE_DIR", os.path.join(base_dir, 'user_data', 'cohort'))
+
+FORMAT_VERSION = 1
+MAX_CONDITIONS = 32  # conditions are one multi-hot uint32 per user
+
+COLUMNS = {
+    "ID": np.int64,
+    "Age": np.int16,
+    "Gender": np.uint8,       # index into meta["genders"]
+    "Weight": np.float64,
+    "Height": np.float64,
+    "Conditions": np.uint32,  # bit i set = meta["conditions"][i]
+    "Registered": np.uint8,   # 1 = signed-up user (ID is theirs), 0 = imported row
+}
+
+
+class CohortStore:
+    """The comparison cohort as one raw little-endian file per column.
+
+    ``meta.json`` holds the row count, the gender/condition vocabularies and
+    an id that changes whenever the store is created anew.
+    Columns are memory-mapped read-only, so worker processes share the same
+    page-cache pages instead of each parsing a CSV. Appends write the column
+    files first and publish the new row count last; readers never see a
+    partial row.
+    """
+
+    def __init__(self, folder=COHORT_STORE_DIR):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        self.meta = None
+        self._columns = {}
+        self.refresh()
+
+    def _path(self, name):
+        return os.path.join(self.folder, name)
+
+    def refresh(self):
+        """Re-map the columns if another process appended rows since the last call."""
+        st = os.stat(self._path("meta.json"))
+        mtime = (st.st_ino, st.st_mtime_ns)  # meta.json is replaced on every append
+        if mtime == self._meta_mtime:
+            return self
+        with self._lock:
+            with open(self._path("meta.json")) as f:
+                meta = json.load(f)
+            if meta.get("format") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported cohort store format {meta.get('format')!r} in {self.folder}")
+            rows = meta["rows"]
+            columns = {}
+            for name, dtype in COLUMNS.items():
+                if rows:
+                    columns[name] = np.memmap(self._path(f"{name}.bin"), dtype=np.dtype(dtype).newbyteorder("<"),
+                                              mode="r", shape=(rows,))
+                else:
+                    columns[name] = np.empty(0, dtype=dtype)
+            self.meta, self._columns, self._meta_mtime = meta, columns, mtime
+        return self
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def column(self, name):
+        return self._columns[name]
+
+    @property
+    def genders(self):
+        return self.meta["genders"]
+
+    @property
+    def conditions(self):
+        return self.meta["conditions"]
+
+    def gender_is(self, gender):
+        """Boolean array: which users have ``gender``."""
+        try:
+            code = self.genders.index(gender)
+        except ValueError:
+            return np.zeros(len(self), dtype=bool)
+        return self.column("Gender") == code
+
+    def registered_user(self, user_id):
+        """Boolean array marking the stored rows of registered user ``user_id``."""
+        return (self.column("Registered") == 1) & (self.column("ID") == int(user_id))
+
+    def condition_mask(self, names):
+        """Multi-hot value of ``names``; conditions nobody in the cohort has are ignored."""
+        mask = 0
+        for name in names:
+            if name in self.conditions:
+                mask |= 1 << self.conditions.index(name)
+        return np.uint32(mask)
+
+    def condition_names(self, mask):
+        return [name for i, name in enumerate(self.conditions) if int(mask) >> i & 1]
+
+    def append(self, users):
+        """Add users (dicts with ID, Age, Gender, Weight, Height, a Conditions list
+        and optionally Registered)."""
+        append_rows(self.folder, users)
+        return self.refresh()
+
+
+def _encode(value, vocabulary, limit=None):
+    if value not in vocabulary:
+        if limit is not None and len(vocabulary) >= limit:
+            raise ValueError(f"Cohort store holds at most {limit} distinct conditions")
+        vocabulary.append(value)
+    return vocabulary.index(value)
+
+
+def _write_meta(folder, meta):
+    tmp = os.path.join(folder, f"meta.json.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(folder, "meta.json"))
+
+
+def create_store(folder, genders=(), conditions=()):
+    """Start an empty store in ``folder`` with the given vocabularies."""
+    if len(conditions) > MAX_CONDITIONS:
+        raise ValueError(f"Cohort store holds at most {MAX_CONDITIONS} distinct conditions")
+    os.makedirs(folder, exist_ok=True)
+    for name in COLUMNS:
+        open(os.path.join(folder, f"{name}.bin"), "wb").close()
+    # "id" tells derived files (e.g. cohort_sketches) built from an older store in this folder apart
+    _write_meta(folder, {"format": FORMAT_VERSION, "id": uuid.uuid4().hex, "rows": 0,
+                         "genders": list(genders), "conditions": list(conditions)})
+
+
+def _append(folder, encode):
+    # encode(meta) -> {column: values}, called with the append lock held
+    with open(os.path.join(folder, "append.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one writer at a time across processes
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+        rows = meta["rows"]
+        values = encode(meta)
+        added = len(values["ID"])
+        for name, dtype in COLUMNS.items():
+            dtype = np.dtype(dtype).newbyteorder("<")
+            with open(os.path.join(folder, f"{name}.bin"), "r+b") as f:
+                f.truncate(rows * dtype.itemsize)  # drop a row half-written by a crashed append
+                f.seek(0, os.SEEK_END)
+                f.write(np.asarray(values[name], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        meta["rows"] = rows + added
+        _write_meta(folder, meta)
+    return meta["rows"]
+
+
+def append_rows(folder, users):
+    """Append users to the store in ``folder``; O(len(users)) whatever the store size."""
+    users = list(users)
+
+    def encode(meta):
+        values = {name: [] for name in COLUMNS}
+        for user in users:
+            bits = 0
+            for condition in user.get("Conditions") or []:
+                bits |= 1 << _encode(condition, meta["conditions"], MAX_CONDITIONS)
+            values["ID"].append(int(user["ID"]))
+            values["Age"].append(int(user["Age"]))
+            values["Gender"].append(_encode(user["Gender"], meta["genders"]))
+            values["Weight"].append(float(user["Weight"]))
+            values["Height"].append(float(user["Height"]))
+            values["Conditions"].append(bits)
+            values["Registered"].append(1 if user.get("Registered") else 0)
+        return values
+    return _append(folder, encode)
+
+
+def append_columns(folder, columns):
+    """Append already encoded column arrays (codes and bits per the store's
+    vocabularies); the fast path for bulk loads."""
+    lengths = {len(columns[name]) for name in COLUMNS}
+    if len(lengths) != 1:
+        raise ValueError("All columns must have the same length")
+    return _append(folder, lambda meta: columns)
+
+
+def convert_csv(csv_path=demo_user_data_path, folder=COHORT_STORE_DIR, replace=True):
+    """Build a fresh store in ``folder`` from a user CSV; returns the row count.
+
+    The store is built in a temporary folder next to ``folder`` and renamed
+    into place, under a lock file beside it so concurrent conversions run one
+    at a time. Processes still mapping a replaced store keep reading its
+    (unlinked) files until they refresh. With ``replace=False`` an existing
+    store is left alone and ``None`` returned.
+    """
+    import shutil
+    folder = os.path.abspath(folder)
+    parent = os.path.dirname(folder)
+    os.makedirs(parent, exist_ok=True)
+    with open(os.path.join(parent, f".{os.path.basename(folder)}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not replace and os.path.exists(os.path.join(folder, "meta.json")):
+            return None  # another process converted it while we waited
+        import pandas as pd
+        df = pd.read_csv(csv_path)
+        users = df[["ID", "Age", "Gender", "Weight", "Height"]].to_dict("records")
+        for user, conditions in zip(users, df["Conditions"]):
+            user["Conditions"] = ast.literal_eval(conditions)
+
+        tmp = f"{folder}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        create_store(tmp)
+        rows = append_rows(tmp, users)
+        old = None
+        if os.path.isdir(folder) and os.listdir(folder):
+            old = f"{folder}.{os.getpid()}.old"
+            os.rename(folder, old)
+        os.replace(tmp, folder)
+        if old is not None:
+            shutil.rmtree(old)
+    return rows
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_cohort_store():
+    """The process-wide store, converted from the demo CSV the first time it is needed."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if not os.path.exists(os.path.join(COHORT_STORE_DIR, "meta.json")):
+                    convert_csv(replace=False)
+                _store = CohortStore()
+    return _store.refresh()
+
+
+if __name__ == "__main__":
+    # python cohort_store.py user_data/demo_user_data.csv user_data/cohort
+    if len(sys.argv) > 3:
+        print("usage: python cohort_store.py [CSV_PATH] [STORE_DIR]", file=sys.stderr)
+        sys.exit(2)
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else demo_user_data_path
+    folder = sys.argv[2] if len(sys.argv) > 2 else COHORT_STORE_DIR
+    print(f"Wrote {convert_csv(csv_path, folder)} users from {csv_path} to {folder}")
@@ -0,0 +1,231 @@
+import os
+import re
+import sys
+import csv
+import json
+import logging
+import sqlite3
+import threading
+from urllib.parse import quote
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+FOOD_INDEX_PATH = os.getenv("FOOD_INDEX_PATH", os.path.join(base_dir, 'cache', 'food_index.sqlite3'))
+SUGGEST_LIMIT = 8
+INSERT_BATCH = 5000
+
+# FoodData Central CSV data_type -> the dataType the API reports; other types (sub-samples etc.) are skipped
+CSV_DATA_TYPES = {
+    "foundation_food": "Foundation",
+    "sr_legacy_food": "SR Legacy",
+    "survey_fndds_food": "Survey (FNDDS)",
+    "branded_food": "Branded",
+}
+
+SCHEMA = """
+CREATE TABLE foods (
+    fdc_id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    data_type TEXT,
+    ingredients TEXT,
+    nutrients TEXT NOT NULL  -- JSON {name: grams per 100 g}
+);
+CREATE VIRTUAL TABLE foods_fts USING fts5(
+    description, content='foods', content_rowid='fdc_id', tokenize='porter unicode61', prefix='2 3'
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def pick_food(foods):
+    # Prefer Foundation / SR Legacy / Survey entries over Branded products
+    for item in foods:
+        if item.get("dataType") != "Branded":
+            return item
+    return foods[0] if foods else None
+
+
+def match_query(text, prefix=False):
+    """FTS5 query matching every word of ``text`` (the last one as a prefix if
+    ``prefix``), or ``None`` when it has no words."""
+    terms = [f'"{word}"' for word in re.findall(r"\w+", text.lower())]
+    if not terms:
+        return None
+    if prefix:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class FoodIndex:
+    """Full-text index of a FoodData Central dump in a read-only SQLite file.
+
+    Searches rank descriptions containing every query word by BM25, so a
+    lookup takes about a millisecond. Each thread keeps its own connection
+    and reopens it when ``import_dump`` replaces the file.
+    """
+
+    def __init__(self, path=FOOD_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        version = _file_version(self.path)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.version != version:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(f"file:{quote(self.path)}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            self._local.conn, self._local.version = conn, version
+        return conn
+
+    def _query(self, sql, params):
+        try:
+            return self._connect().execute(sql, params).fetchall()
+        except (OSError, sqlite3.Error):
+            logger.exception("Food index %s could not be read", self.path)
+            return []
+
+    def search(self, query, page_size=5, prefix=False):
+        """Best matches as API-style ``{"fdcId", "description", "dataType"}`` dicts."""
+        match = match_query(query, prefix)
+        if match is None:
+            return []
+        rows = self._query(
+            "SELECT f.fdc_id, f.description, f.data_type FROM foods_fts JOIN foods f ON f.fdc_id = foods_fts.rowid "
+            "WHERE foods_fts MATCH ? ORDER BY rank LIMIT ?", (match, page_size))
+        return [{"fdcId": row["fdc_id"], "description": row["description"], "dataType": row["data_type"]}
+                for row in rows]
+
+    def food(self, fdc_id):
+        rows = self._query("SELECT * FROM foods WHERE fdc_id = ?", (int(fdc_id),))
+        if not rows:
+            return None
+        row = rows[0]
+        return {"fdc_id": row["fdc_id"], "description": row["description"],
+                "nutrients": json.loads(row["nutrients"]), "ingredients": row["ingredients"]}
+
+    def lookup(self, query):
+        """Like ``nutrition.lookup_food`` but from the index; ``None`` when no food has every word."""
+        food = pick_food(self.search(query, page_size=5))
+        return self.food(food["fdcId"]) if food else None
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """Foods for an autocomplete box, the last word typed so far matched as a prefix."""
+        return [{"fdc_id": food["fdcId"], "description": food["description"]}
+                for food in self.search(prefix, page_size=limit, prefix=True)]
+
+    def __len__(self):
+        rows = self._query("SELECT COUNT(*) FROM foods", ())
+        return rows[0][0] if rows else 0
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_food_index():
+    """The local food index, or ``None`` until a dump has been imported to ``FOOD_INDEX_PATH``."""
+    global _index
+    if _index is None:
+        if not os.path.exists(FOOD_INDEX_PATH):
+            return None
+        with _index_lock:
+            if _index is None:
+                _index = FoodIndex()
+    return _index
+
+
+def _json_foods(path):
+    # FoundationDownload.json etc.: {"FoundationFoods": [...]}, {"SRLegacyFoods": [...]}, ...
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    lists = data.values() if isinstance(data, dict) else [data]
+    for foods in lists:
+        if isinstance(foods, list):
+            yield from (food for food in foods if isinstance(food, dict) and "fdcId" in food)
+
+
+def _csv_rows(folder, name):
+    with open(os.path.join(folder, name), newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def _csv_foods(folder):
+    # The CSV download: food.csv, nutrient.csv, food_nutrient.csv and, for Branded foods, branded_food.csv
+    foods = {}
+    for row in _csv_rows(folder, "food.csv"):
+        data_type = CSV_DATA_TYPES.get(row["data_type"])
+        if data_type:
+            foods[int(row["fdc_id"])] = {"fdcId": int(row["fdc_id"]), "description": row["description"],
+                                         "dataType": data_type, "foodNutrients": []}
+    units = {row["id"]: (row["name"], row["unit_name"].lower()) for row in _csv_rows(folder, "nutrient.csv")}
+    for row in _csv_rows(folder, "food_nutrient.csv"):
+        food = foods.get(int(row["fdc_id"]))
+        if food is not None and row["nutrient_id"] in units and row["amount"]:
+            name, unit = units[row["nutrient_id"]]
+            food["foodNutrients"].append({"nutrient": {"name": name, "unitName": unit}, "amount": float(row["amount"])})
+    if os.path.exists(os.path.join(folder, "branded_food.csv")):
+        for row in _csv_rows(folder, "branded_food.csv"):
+            food = foods.get(int(row["fdc_id"]))
+            if food is not None:
+                food["ingredients"] = row.get("ingredients") or None
+    return foods.values()
+
+
+def import_dump(path, db_path=FOOD_INDEX_PATH):
+    """Index a FoodData Central download: a JSON file or an unzipped CSV folder.
+
+    Nutrient amounts in the dumps are per 100 g and are stored in grams, as
+    ``nutrition.nutrients_in_grams`` reports them. The index is built next to
+    ``db_path`` and swapped in at the end, so workers keep serving the old
+    one meanwhile. Returns the number of foods indexed.
+    """
+    from nutrition import nutrients_in_grams
+    foods = _csv_foods(path) if os.path.isdir(path) else _json_foods(path)
+
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    tmp = f"{db_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    count = 0
+    try:
+        conn.executescript(SCHEMA)
+        batch = []
+        for food in foods:
+            nutrients = nutrients_in_grams(food)
+            if not nutrients:  # nothing lookup_food could report
+                continue
+            batch.append((food["fdcId"], food.get("description", ""), food.get("dataType"),
+                          food.get("ingredients") or None, json.dumps(nutrients)))
+            if len(batch) >= INSERT_BATCH:
+                conn.executemany("INSERT OR REPLACE INTO foods VALUES (?, ?, ?, ?, ?)", batch)
+                count += len(batch)
+                batch = []
+        conn.executemany("INSERT OR REPLACE INTO foods VALUES (?, ?, ?, ?, ?)", batch)
+        count += len(batch)
+        conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('optimize')")
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp)
+        raise
+    conn.close()
+    os.replace(tmp, db_path)
+    return count
+
+
+if __name__ == "__main__":
+    # python food_index.py FoodData_Central_sr_legacy_food_json.json [food_index.sqlite3]
+    if len(sys.argv) < 2:
+        print("usage: python food_index.py DUMP_JSON_OR_CSV_DIR [DB_PATH]", file=sys.stderr)
+        sys.exit(2)
+    db_path = sys.argv[2] if len(sys.argv) > 2 else FOOD_INDEX_PATH
+    print(f"Indexed {import_dump(sys.argv[1], db_path)} foods from {sys.argv[1]} into {db_path}")
@@ -0,0 +1,102 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+UPLOAD_FOLDER = os.path.join(base_dir, 'uploaded_images')
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "500"))          # total size kept on disk
+UPLOAD_MAX_AGE_DAYS = float(os.getenv("UPLOAD_MAX_AGE_DAYS", "30"))
+UPLOAD_KEEP = os.getenv("UPLOAD_KEEP", "1") == "1"  # keep uploaded originals on disk (written in the background)
+EVICT_EVERY = 50  # uploads between eviction sweeps
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_type(data):
+    """``"jpg"``, ``"png"`` or ``"webp"`` judged by the file signature, else ``None``."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class ImageStore:
+    """Uploaded images stored under the SHA-256 of their bytes.
+
+    Re-uploading the same picture reuses the existing file. Files older than
+    ``max_age`` seconds, then the least recently uploaded ones beyond
+    ``max_bytes``, are removed by ``evict``.
+    """
+
+    def __init__(self, folder=UPLOAD_FOLDER, max_bytes=UPLOAD_MAX_MB * 1024 * 1024,
+                 max_age=UPLOAD_MAX_AGE_DAYS * 86400):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def path_for(self, digest, ext):
+        return os.path.join(self.folder, f"{digest}.{ext}")
+
+    def put_later(self, data, ext):
+        """Store ``data`` on a background thread, so an upload is not held up
+        by the disk. Returns ``(digest, future of the path)`` right away."""
+        digest = content_hash(data)
+        with self._lock:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-store")
+        return digest, self._writer.submit(lambda: self._write(digest, data, ext)[1])
+
+    def _write(self, digest, data, ext):
+        ext = ext.lower()
+        path = self.path_for(digest, "jpg" if ext == "jpeg" else ext)
+        os.makedirs(self.folder, exist_ok=True)
+        if os.path.exists(path):
+            os.utime(path)  # refresh its place in the eviction order
+        else:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._puts += 1
+            sweep = self._puts % EVICT_EVERY == 1
+        if sweep:
+            self.evict()
+        return digest, path
+
+    def evict(self, now=None):
+        now = now or time.time()
+        files = []
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age:
+                self._remove(entry.path)
+            else:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,119 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import threading
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+INGREDIENT_DB_PATH = os.getenv(
+    "INGREDIENT_DB_PATH",
+    os.path.join(base_dir, 'updated_ingredients_conditions', 'updated_ingredients_conditions.csv'))
+INGREDIENT_RELOAD_SECONDS = float(os.getenv("INGREDIENT_RELOAD_SECONDS", "10"))  # negative never reloads
+
+logger = logging.getLogger(__name__)
+
+
+class IngredientSnapshot:
+    """One version of the ingredient/condition table with everything derived from it.
+
+    Snapshots are never modified after construction (apart from the file
+    signature they were last seen with), so a request that picked one up
+    keeps a consistent view while a newer version is swapped in.
+    """
+
+    def __init__(self, data, signature):
+        self.version = hashlib.sha1(data).hexdigest()[:12]
+        self.signature = signature
+        # pandas and rapidfuzz are imported with the first table, not with this module
+        import pandas as pd
+        from matcher import IngredientIndex
+        from verdicts import VerdictTable
+        fic = pd.read_csv(io.BytesIO(data), index_col=0)
+        self.index = IngredientIndex(fic.index.tolist())
+        self.table = VerdictTable(fic)
+        self.conditions = fic.columns.tolist()[3:]  # offered on /signup
+
+
+class IngredientDB:
+    """The ingredient table, reloaded when its file changes.
+
+    ``current()`` returns the live snapshot. At most every ``check_every``
+    seconds one caller stats the file; only when its mtime or size moved is
+    it read and hashed, and only a new hash builds a new snapshot. The
+    build happens under a lock, so each process rebuilds once per version,
+    and a table that fails to parse leaves the previous one in service.
+    """
+
+    def __init__(self, path=INGREDIENT_DB_PATH, check_every=INGREDIENT_RELOAD_SECONDS):
+        self.path = path
+        self.check_every = check_every
+        self.reloads = 0
+        self._snapshot = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def current(self):
+        snapshot = self._snapshot
+        if snapshot is None or (self.check_every >= 0 and time.monotonic() - self._checked >= self.check_every):
+            return self._refresh()
+        return snapshot
+
+    def _refresh(self):
+        with self._lock:
+            snapshot = self._snapshot
+            now = time.monotonic()
+            if snapshot is not None and (self.check_every < 0 or now - self._checked < self.check_every):
+                return snapshot  # another thread just checked
+            self._checked = now
+
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                if snapshot is None:
+                    raise
+                logger.warning("Ingredient table %s is unreadable, keeping version %s", self.path, snapshot.version)
+                return snapshot
+            signature = (st.st_mtime_ns, st.st_size)
+            if snapshot is not None and signature == snapshot.signature:
+                return snapshot
+
+            with open(self.path, "rb") as f:
+                data = f.read()
+            if snapshot is not None and hashlib.sha1(data).hexdigest()[:12] == snapshot.version:
+                snapshot.signature = signature  # touched but unchanged
+                return snapshot
+
+            try:
+                new = IngredientSnapshot(data, signature)
+            except Exception:
+                if snapshot is None:
+                    raise
+                logger.exception("Could not load ingredient table %s, keeping version %s", self.path, snapshot.version)
+                return snapshot
+            self._snapshot = new
+            self.reloads += 1
+            if snapshot is not None:
+                logger.info("Reloaded ingredient table: version %s -> %s", snapshot.version, new.version)
+            return new
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def get_ingredient_db():
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = IngredientDB()
+    return _db
+
+
+def current():
+    return get_ingredient_db().current()
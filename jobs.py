@@ -0,0 +1,233 @@
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+import tracing
+
+OCR_JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS", "1"))    # 0 runs jobs on a thread in the web process
+OCR_JOB_QUEUE = int(os.getenv("OCR_JOB_QUEUE", "8"))        # max jobs queued or running per web worker
+OCR_JOB_TIMEOUT = float(os.getenv("OCR_JOB_TIMEOUT", "60"))  # seconds before a job is reported as failed
+OCR_RETRY_AFTER = int(os.getenv("OCR_RETRY_AFTER", "5"))     # Retry-After sent with 503 when saturated
+JOB_TTL = 600  # finished jobs are forgotten after this many seconds
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+TIMEOUT = "timeout"
+UNKNOWN = "unknown"
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after=OCR_RETRY_AFTER):
+        super().__init__("job queue is full")
+        self.retry_after = retry_after
+
+
+class Job:
+    __slots__ = ("id", "future", "submitted", "started", "finished", "meta")
+
+    def __init__(self, job_id, future, meta):
+        self.id = job_id
+        self.future = future
+        self.submitted = time.monotonic()
+        self.started = None   # when a pool slot picked it up
+        self.finished = None  # when the worker let go of it
+        self.meta = meta
+
+
+class JobQueue:
+    """Bounded background job runner.
+
+    Jobs run in a local process pool so slow OCR work never blocks the Flask
+    worker that accepted the upload. ``submit`` raises ``QueueFull`` once
+    ``max_pending`` jobs are queued or running. The timeout runs from when a
+    slot picks a job up; a job past it is reported as timed out but keeps
+    counting against the queue until its worker is actually free.
+    """
+
+    def __init__(self, workers=OCR_JOB_WORKERS, max_pending=OCR_JOB_QUEUE, timeout=OCR_JOB_TIMEOUT,
+                 retry_after=OCR_RETRY_AFTER, initializer=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.initializer = initializer
+        self._executor = None
+        self._jobs = {}
+        self._waiting = deque()  # submitted but not yet started, in pool order
+        self._running = 0  # counted until the worker is free, even past the timeout
+        self._lock = threading.RLock()  # a finished future runs its callbacks on add
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn keeps torch out of a forked, multi-threaded web process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1, initializer=self.initializer)
+        return self._executor
+
+    def _is_expired(self, job, now):
+        return not job.future.done() and job.started is not None and now - job.started > self.timeout
+
+    def _track(self, job, inner):
+        # The pool runs work first in, first out, so a job starts when an
+        # earlier one frees its slot.
+        if self._running < max(1, self.workers):
+            job.started = time.monotonic()
+            self._running += 1
+        else:
+            self._waiting.append(job)
+        inner.add_done_callback(lambda f: self._release(job))
+
+    def _release(self, job):
+        with self._lock:
+            now = time.monotonic()
+            job.finished = now
+            if job.started is None:  # cancelled while queued
+                self._waiting.remove(job)
+                return
+            self._running -= 1
+            while self._waiting and self._running < max(1, self.workers):
+                self._waiting.popleft().started = now
+                self._running += 1
+
+    def _joinable(self, job, now):
+        # anything but a failed, timed out or cancelled job
+        if job.future.cancelled():
+            return False
+        if job.future.done():
+            return job.future.exception() is None
+        return not self._is_expired(job, now)
+
+    def _prune(self, now):
+        for job_id, job in list(self._jobs.items()):
+            if self._is_expired(job, now):
+                # A running process cannot be interrupted; report the timeout
+                # now and discard the result when it lands.
+                job.future.cancel()
+            if job.finished is not None and now - job.finished > JOB_TTL:
+                del self._jobs[job_id]
+
+    def depth(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            return self._running + len(self._waiting)
+
+    def submit(self, fn, *args, job_id=None, **meta):
+        """Queue ``fn(*args)`` and return its job id.
+
+        Passing an explicit ``job_id`` (e.g. a content hash) joins a job with
+        that id that is still queued, running or finished instead of starting
+        a second one.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            existing = self._jobs.get(job_id) if job_id else None
+            if existing is not None and self._joinable(existing, now):
+                return job_id
+            if self._running + len(self._waiting) >= self.max_pending:
+                raise QueueFull(self.retry_after)
+            job_id = job_id or uuid.uuid4().hex
+            inner = self._get_executor().submit(tracing.run_collected, fn, *args)
+            job = self._jobs[job_id] = Job(job_id, self._traced(inner), meta)
+            self._track(job, inner)
+            return job_id
+
+    @staticmethod
+    def _traced(inner):
+        # The job reports the stages it ran in the worker; record them here,
+        # where /metrics is served, and hand out a future of the bare result.
+        submitted = time.perf_counter()
+        outer = Future()
+
+        def done(f):
+            if f.cancelled():
+                outer.cancel()
+                return
+            try:
+                result, stages = f.result()
+            except Exception as e:
+                result, stages, error = None, {}, e
+            else:
+                error = None
+            tracing.record_all(stages)
+            tracing.record("job_total", time.perf_counter() - submitted)
+            try:
+                if error is not None:
+                    outer.set_exception(error)
+                else:
+                    outer.set_result(result)
+            except InvalidStateError:
+                pass  # timed out and cancelled meanwhile
+
+        outer.add_done_callback(lambda f: f.cancelled() and inner.cancel())
+        inner.add_done_callback(done)
+        return outer
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id, wait=0):
+        """Return ``(state, result)`` for a job, waiting up to ``wait`` seconds."""
+        job = self.get(job_id)
+        if job is None:
+            return UNKNOWN, None
+
+        with self._lock:
+            started = job.started
+        remaining = self.timeout - (time.monotonic() - started) if started is not None else self.timeout
+        if wait and remaining > 0:
+            try:
+                job.future.result(timeout=min(wait, remaining))
+            except Exception:
+                # still running, or failed; either way reported below
+                pass
+
+        if job.future.done() and not job.future.cancelled():
+            exc = job.future.exception()
+            if exc is not None:
+                return FAILED, exc
+            return DONE, job.future.result()
+        if self._is_expired(job, time.monotonic()) or job.future.cancelled():
+            return TIMEOUT, None
+        return PENDING, None
+
+    def warmup(self, fn):
+        """Run ``fn`` once per pool slot ahead of traffic (e.g. to load OCR models)."""
+        executor = self._get_executor()
+        futures = []
+        with self._lock:
+            for _ in range(max(1, self.workers)):
+                future = executor.submit(fn)
+                self._track(Job(None, future, {}), future)
+                futures.append(future)
+        return futures
+
+    def shutdown(self, wait=False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
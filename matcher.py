@@ -0,0 +1,168 @@
+import os
+import numpy as np
+from rapidfuzz import fuzz, process
+from cache import LRUCache, MISSING
+
+FUZZY_THRESHOLD = 89
+FUZZY_WORKERS = int(os.getenv("FUZZY_WORKERS", "1"))  # threads used by rapidfuzz.cdist, -1 = all cores
+RESOLUTION_CACHE_SIZE = 4096
+
+# WRatio scales partial matches by 0.6 once one string is 8x longer than the
+# other (and the plain ratio is below 23 there), so such pairs can never reach
+# the threshold.
+MAX_LENGTH_RATIO = 8
+
+
+def normalize_tokens(text):
+    # Same cleaning as scanner.normalize_text: letters only, lower case
+    text = text.lower()
+    return ''.join([c if c.isalpha() or c.isspace() else ' ' for c in text]).split()
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton over word tokens.
+
+    Finds every occurrence of every pattern (including overlapping ones, e.g.
+    "corn syrup" inside "high fructose corn syrup") in one pass over the text,
+    whatever the pattern length.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for tokens, value in patterns:
+            if tokens:
+                self._insert(tuple(tokens), value)
+        self._link()
+
+    def _insert(self, tokens, value):
+        node = 0
+        for token in tokens:
+            nxt = self.goto[node].get(token)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][token] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(tokens), value))
+
+    def _link(self):
+        frontier = list(self.goto[0].values())
+        while frontier:
+            nxt_frontier = []
+            for node in frontier:
+                for token, child in self.goto[node].items():
+                    state = self.fail[node]
+                    while state and token not in self.goto[state]:
+                        state = self.fail[state]
+                    self.fail[child] = self.goto[state].get(token, 0)
+                    self.out[child] = self.out[child] + self.out[self.fail[child]]
+                    nxt_frontier.append(child)
+            frontier = nxt_frontier
+
+    def find(self, tokens):
+        """Yield ``(start, end, value)`` for every match in ``tokens``."""
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for i, token in enumerate(tokens):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for length, value in out[state]:
+                yield i - length + 1, i + 1, value
+
+
+class IngredientIndex:
+    """Ingredient names prepared once for repeated label matching.
+
+    Gives the same answer as testing each phrase against the name list and
+    then calling ``process.extractOne`` (WRatio) for the misses, but does the
+    fuzzy part as one ``cdist`` call and remembers phrase resolutions across
+    requests.
+    """
+
+    def __init__(self, names, threshold=FUZZY_THRESHOLD, cache_size=RESOLUTION_CACHE_SIZE, workers=FUZZY_WORKERS):
+        self.names = [str(name).lower() for name in names]
+        self.exact = set(self.names)
+        self.threshold = threshold
+        self.workers = workers
+        lengths = [len(name) for name in self.names if name]
+        self.min_len = min(lengths, default=0)
+        self.max_len = max(lengths, default=0)
+        self.resolved = LRUCache(cache_size)
+
+        # Patterns are the names cleaned like OCR text, so "Beta-carotene" is
+        # found as "beta carotene"; hits report the original (lower-case) name.
+        patterns = {}
+        for name in self.names:
+            patterns.setdefault(tuple(normalize_tokens(name)), name)
+        self.automaton = TokenAutomaton((tokens, name) for tokens, name in patterns.items())
+
+    def could_match(self, phrase):
+        # Length bound only: WRatio's token-set and partial scoring match
+        # across tokens ("corn syrup" reaches "high fructose corn syrup"), so
+        # a first-token prefilter would change results.
+        n = len(phrase)
+        if not n or not self.max_len:
+            return False
+        return n * MAX_LENGTH_RATIO > self.min_len and n < self.max_len * MAX_LENGTH_RATIO
+
+    def resolve(self, phrases):
+        """Map each non-exact phrase to its best fuzzy ingredient, or ``None``."""
+        out = {}
+        todo = []
+        for phrase in phrases:
+            hit = self.resolved.get(phrase)
+            if hit is MISSING:
+                todo.append(phrase)
+            else:
+                out[phrase] = hit
+
+        candidates = []
+        for phrase in todo:
+            if self.could_match(phrase):
+                candidates.append(phrase)
+            else:
+                out[phrase] = None
+                self.resolved.put(phrase, None)
+
+        if candidates:
+            scores = process.cdist(candidates, self.names, scorer=fuzz.WRatio, dtype=np.float64,
+                                   score_cutoff=self.threshold, workers=self.workers)
+            best = scores.argmax(axis=1)  # first best, like extractOne
+            for row, phrase in enumerate(candidates):
+                col = best[row]
+                match = self.names[col] if scores[row, col] >= self.threshold else None
+                out[phrase] = match
+                self.resolved.put(phrase, match)
+        return out
+
+    def scan(self, words):
+        """Return the exact ingredients in ``words`` and the spans no ingredient covers."""
+        found = set()
+        covered = [False] * len(words)
+        for start, end, name in self.automaton.find(words):
+            found.add(name)
+            covered[start:end] = [True] * (end - start)
+
+        spans = []
+        start = None
+        for i, is_covered in enumerate(covered):
+            if not is_covered and start is None:
+                start = i
+            elif is_covered and start is not None:
+                spans.append(words[start:i])
+                start = None
+        if start is not None:
+            spans.append(words[start:])
+        return found, spans
+
+    def match(self, phrases):
+        phrases = set(phrases)
+        matched = {p for p in phrases if p in self.exact}
+        unmatched = [p for p in phrases if p not in self.exact]
+        fuzzy_selected = {m for m in self.resolve(unmatched).values() if m is not None}
+        return matched | fuzzy_selected
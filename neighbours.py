@@ -0,0 +1,136 @@
+import os
+import threading
+import numpy as np
+
+NEIGHBOURS_K = int(os.getenv("NEIGHBOURS_K", "200"))  # users in a "people like me" cohort
+CONDITION_WEIGHT = 1.0   # distance added by condition sets with nothing in common, in standard deviations
+REBUILD_FRACTION = 0.05  # inserted rows, as a share of the tree, that trigger a rebuild
+REBUILD_MIN = 1024
+CANDIDATE_FACTOR = 8     # nearest users by body measurements re-ranked per wanted neighbour
+GENDER_SCALE = np.sqrt(0.5)  # one-hot value that puts two different genders exactly 1 apart
+
+
+def jaccard_distance(bits, user_bits):
+    """1 - |A & B| / |A | B| for multi-hot condition sets; two empty sets are identical."""
+    union = np.bitwise_count(bits | user_bits)
+    common = np.bitwise_count(bits & user_bits)
+    return 1.0 - np.where(union == 0, 1.0, common / np.maximum(union, 1))
+
+
+class NeighbourIndex:
+    """k most similar users of a ``cohort_store.CohortStore``.
+
+    Users are points of z-scored age, height and weight plus their one-hot
+    gender (a different gender counts as one standard deviation), held in a
+    KD-tree. A gender the store has not seen is encoded as no gender at all,
+    which is equally far from every one. The ``CANDIDATE_FACTOR * k`` nearest of them are re-ranked by
+    that distance plus ``CONDITION_WEIGHT`` times the Jaccard distance of
+    the condition sets, so a query costs the same at any cohort size. Rows
+    appended after the build go to a buffer that is searched by brute
+    force, and the tree is rebuilt once the buffer holds
+    ``REBUILD_FRACTION`` of it.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.store_id = store.meta.get("id")
+        self._lock = threading.Lock()
+        self._build(len(store))
+
+    def _raw(self, start, stop):
+        store = self.store
+        return np.column_stack([store.column(name)[start:stop].astype(float) for name in ("Age", "Height", "Weight")])
+
+    def _points(self, start, stop):
+        raw = (self._raw(start, stop) - self.mean) / self.scale
+        gender = np.zeros((len(raw), len(self.genders)))
+        gender[np.arange(len(raw)), self.store.column("Gender")[start:stop]] = GENDER_SCALE
+        return np.hstack([raw, gender])
+
+    def _build(self, rows):
+        from scipy.spatial import cKDTree  # only workers drawing comparison plots pay for scipy
+        raw = self._raw(0, rows)
+        self.genders = list(self.store.genders)
+        self.mean = raw.mean(axis=0) if rows else np.zeros(3)
+        self.scale = np.maximum(raw.std(axis=0), 1.0) if rows > 1 else np.full(3, 10.0)
+        self.tree = cKDTree(self._points(0, rows)) if rows else None
+        self.built = rows
+        self._buffer = np.empty((REBUILD_MIN, 3 + len(self.genders)))
+        self.inserted = 0
+
+    def __len__(self):
+        return self.built + self.inserted
+
+    def sync(self):
+        """Index the rows appended to the store since the last call."""
+        rows = len(self.store.refresh())
+        if rows <= len(self):
+            return 0
+        with self._lock:
+            start = len(self)
+            grown = len(self.store.genders) > len(self.genders)  # a new gender is a new dimension
+            if grown or rows - self.built > max(REBUILD_MIN, REBUILD_FRACTION * self.built):
+                self._build(rows)
+                return rows - start
+            points = self._points(start, rows)
+            end = self.inserted + len(points)
+            if end > len(self._buffer):
+                buffer = np.empty((max(end, 2 * len(self._buffer)), self._buffer.shape[1]))
+                buffer[:self.inserted] = self._buffer[:self.inserted]
+                self._buffer = buffer
+            self._buffer[self.inserted:end] = points  # readers only look at [:inserted]
+            self.inserted = end
+            return rows - start
+
+    def covers(self, store):
+        return self.store_id == store.meta.get("id") and len(self) <= len(store)
+
+    def query(self, age, height, weight, gender, condition_bits=0, k=NEIGHBOURS_K, exclude_id=None):
+        """Store rows of the ``k`` users most like this one, most similar first.
+
+        ``exclude_id`` leaves out the stored row of that registered user.
+        """
+        store = self.store
+        with self._lock:
+            tree, built, buffer, inserted = self.tree, self.built, self._buffer, self.inserted
+            mean, scale, genders = self.mean, self.scale, self.genders  # a rebuild re-normalizes
+        one_hot = np.zeros(len(genders))
+        if gender in genders:
+            one_hot[genders.index(gender)] = GENDER_SCALE
+        point = np.concatenate([(np.array([age, height, weight], dtype=float) - mean) / scale, one_hot])
+
+        buffer_rows = np.arange(built, built + inserted)
+        buffer_dist = np.linalg.norm(buffer[:inserted] - point, axis=1)
+        bits = store.column("Conditions")
+        registered = store.column("Registered")
+        ids = store.column("ID")
+        user_bits = np.uint32(condition_bits)
+
+        fetch = min(built, (k + 1) * CANDIDATE_FACTOR)
+        if fetch:
+            dist, rows = tree.query(point, k=fetch)
+            dist, rows = np.atleast_1d(dist), np.atleast_1d(rows)
+        else:
+            dist, rows = np.empty(0), np.empty(0, dtype=np.int64)
+        rows = np.concatenate([rows, buffer_rows])
+        score = np.concatenate([dist, buffer_dist]) + CONDITION_WEIGHT * jaccard_distance(bits[rows], user_bits)
+        if exclude_id is not None:
+            own = (registered[rows] == 1) & (ids[rows] == int(exclude_id))
+            rows, score = rows[~own], score[~own]
+        return rows[np.argsort(score, kind="stable")[:k]]
+
+
+_indexes = {}  # store folder -> NeighbourIndex
+_indexes_lock = threading.Lock()
+
+
+def get_neighbour_index(store):
+    """The index of ``store``, built on first use and kept in step with its appends."""
+    index = _indexes.get(store.folder)
+    if index is None or not index.covers(store.refresh()):  # first use, or the store was rebuilt
+        with _indexes_lock:
+            index = _indexes.get(store.folder)
+            if index is None or not index.covers(store):
+                index = _indexes[store.folder] = NeighbourIndex(store)
+    index.sync()
+    return index
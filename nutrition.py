@@ -1,43 +1,16 @@
-import requests
-
-import matplotlib
-matplotlib.use('Agg')  #  Use a non-GUI backend suitable for web apps
-
-import matplotlib.pyplot as plt
+import re
+from concurrent.futures import ThreadPoolExecutor
+from usda import get_client, USDAError
+from food_index import get_food_index, pick_food
+from tracing import stage
+from render import get_renderer
 from dotenv import load_dotenv
 import os
 load_dotenv()
 
 USDA_API_KEY = os.getenv("USDA_API_KEY")
 
-def get_food_nutrients_in_grams(food_name, api_key=USDA_API_KEY):
-    search_url = "https://api.nal.usda.gov/fdc/v1/foods/search"
-    search_params = {
-        "api_key": api_key,
-        "query": food_name,
-        "pageSize": 5,
-    }
-    search_response = requests.get(search_url, params=search_params)
-    search_data = search_response.json()
-
-    foods = search_data.get("foods", [])
-    food = None
-    for item in foods:
-        if item.get("dataType") != "Branded":
-            food = item
-            break
-    if not food and foods:
-        food = foods[0]
-
-    if not food:
-        return None
-
-    fdc_id = food["fdcId"]
-    detail_url = f"https://api.nal.usda.gov/fdc/v1/food/{fdc_id}"
-    detail_params = {"api_key": api_key}
-    detail_response = requests.get(detail_url, params=detail_params)
-    detail_data = detail_response.json()
-
+def nutrients_in_grams(detail_data):
     nutrients_raw = detail_data.get("foodNutrients", [])
     nutrients_g = {}
 
@@ -56,13 +29,130 @@ def get_food_nutrients_in_grams(food_name, api_key=USDA_API_KEY):
         if amount_g > 0:
             nutrients_g[name] = nutrients_g.get(name, 0) + amount_g
 
+    return nutrients_g
+
+
+def lookup_food(food_name, api_key=USDA_API_KEY):
+    """Best FoodData Central match for ``food_name`` as a dict with its
+    ``fdc_id``, ``description``, ``nutrients`` (grams) and ``ingredients``.
+
+    The local food index answers first; the API is only asked about foods
+    it does not have.
+    """
+    index = get_food_index()
+    if index is not None:
+        with stage("food_index"):
+            food = index.lookup(food_name)
+        if food:
+            return food
+
+    client = get_client(api_key)
+    try:
+        with stage("usda_search"):
+            food = pick_food(client.search(food_name, page_size=5).get("foods", []))
+        if not food:
+            return None
+        with stage("usda_detail"):
+            detail_data = client.food(food["fdcId"])
+    except USDAError:
+        return None
+
+    nutrients_g = nutrients_in_grams(detail_data)
     if not nutrients_g:
         return None
 
-    # Extract ingredients info if available (string)
-    ingredients_info = detail_data.get("ingredients", None)
+    return {
+        "fdc_id": food["fdcId"],
+        "description": food.get("description", food_name),
+        "nutrients": nutrients_g,
+        # Extract ingredients info if available (string)
+        "ingredients": detail_data.get("ingredients", None),
+    }
+
+
+def get_food_nutrients_in_grams(food_name, api_key=USDA_API_KEY):
+    food = lookup_food(food_name, api_key)
+    if not food:
+        return None
+    return food["nutrients"], food["description"], food["ingredients"]
+
+
+MEAL_MAX_ITEMS = 20
+MEAL_SEARCH_THREADS = 8
+
+
+def split_meal(meal):
+    return [item.strip() for item in re.split(r"[,;\n]+", meal) if item.strip()][:MEAL_MAX_ITEMS]
 
-    return nutrients_g, food.get("description", food_name), ingredients_info
+
+def analyse_meal(meal, api_key=USDA_API_KEY):
+    """Nutrients of a whole meal, e.g. "oatmeal, banana, whole milk, coffee".
+
+    Foods are looked up in the local food index first. The rest are searched
+    concurrently and their details fetched with one batch request. Returns a
+    dict with the resolved ``items``, the ``missing`` foods, the summed
+    ``nutrients`` (grams) and ``warnings`` for the total, or ``None`` when
+    nothing could be resolved.
+    """
+    names = split_meal(meal) if isinstance(meal, str) else list(meal)[:MEAL_MAX_ITEMS]
+    if not names:
+        return None
+
+    found = {}  # position in names -> {fdc_id, description, nutrients}
+    index = get_food_index()
+    if index is not None:
+        with stage("food_index"):
+            for i, name in enumerate(names):
+                food = index.lookup(name)
+                if food:
+                    found[i] = food
+
+    remote = [i for i in range(len(names)) if i not in found]
+    if remote:
+        client = get_client(api_key)
+
+        def search(name):
+            try:
+                return pick_food(client.search(name, page_size=5).get("foods", []))
+            except USDAError:
+                return None
+
+        with stage("usda_search"), ThreadPoolExecutor(max_workers=min(MEAL_SEARCH_THREADS, len(remote))) as pool:
+            picked = list(pool.map(search, [names[i] for i in remote]))
+
+        try:
+            with stage("usda_detail"):
+                details = client.foods([food["fdcId"] for food in picked if food])
+        except USDAError:
+            details = {}
+
+        for i, food in zip(remote, picked):
+            detail_data = details.get(food["fdcId"]) if food else None
+            nutrients_g = nutrients_in_grams(detail_data) if detail_data else {}
+            if nutrients_g:
+                found[i] = {"fdc_id": food["fdcId"], "description": food.get("description", names[i]),
+                            "nutrients": nutrients_g}
+
+    items = []
+    missing = []
+    totals = {}
+    for i, name in enumerate(names):
+        food = found.get(i)
+        if not food:
+            missing.append(name)
+            continue
+        items.append({
+            "query": name,
+            "fdc_id": food["fdc_id"],
+            "description": food["description"],
+            "nutrients": food["nutrients"],
+        })
+        for key, value in food["nutrients"].items():
+            totals[key] = totals.get(key, 0) + value
+
+    if not items:
+        return None
+    return {"items": items, "missing": missing, "nutrients": totals, "warnings": get_dietary_warnings(totals)}
 
 
 def get_value_by_partial_key(nutrients, keyword):
@@ -108,35 +198,14 @@ def plot_nutrient_pie_chart_grams(nutrients_g, food_name, save_path):
     if not main_nutrients:
         return
 
-    labels = list(main_nutrients.keys())
-    sizes = list(main_nutrients.values())
-
-    def autopct_func(pct):
-        return f'{pct:.1f}%' if pct >= 3 else ''
-
-    display_labels = [label if (val / sum(sizes)) * 100 >= 3 else '' for label, val in zip(labels, sizes)]
-
-    fig, ax = plt.subplots(figsize=(10, 10), dpi=150)  # Bigger figure and higher DPI
-    wedges, texts, autotexts = ax.pie(
-        sizes,
-        labels=display_labels,
-        autopct=autopct_func,
-        startangle=90,
-        textprops={'fontsize': 12}
-    )
-    ax.axis('equal')
-    ax.legend(
-    [f'{k}: {v:.2f}g' for k, v in main_nutrients.items()],
-    loc='center left',              # Anchor from the left of the legend
-    bbox_to_anchor=(1.05, 0.5),     # Push legend OUTSIDE to the right
-    fontsize=14,
-    frameon=False
-)
-
-
-    plt.title(f"Nutrient Distribution in {food_name.title()}", fontsize=16)
-    plt.savefig(save_path, bbox_inches='tight', dpi=150)  # Save with higher DPI
-    plt.close()
+    data = {
+        "labels": list(main_nutrients.keys()),
+        "sizes": [float(v) for v in main_nutrients.values()],
+        "title": f"Nutrient Distribution in {food_name.title()}",
+    }
+    image, timings = get_renderer().render("nutrient_pie", data)
+    with open(save_path, "wb") as f:
+        f.write(image)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+
+# EasyOCR (and torch behind it) is only imported when the first reader is built,
+# so importing this module stays cheap.
+OCR_LANGUAGES = ["en"]
+OCR_READERS = int(os.getenv("OCR_READERS", "1"))  # reader instances per worker process
+OCR_GPU = os.getenv("OCR_GPU", "0") == "1"
+MIN_CONFIDENCE = 0.5
+_RETRY = object()  # put in the idle queue when a reader could not be built, to wake a waiter
+
+
+class OCREngine:
+    """Process-wide pool of EasyOCR readers.
+
+    Readers are built on first use (or by ``warmup``) and then reused, so a
+    request only pays for inference. Each reader serves one call at a time;
+    callers block until one is free.
+    """
+
+    def __init__(self, languages=None, readers=OCR_READERS, gpu=OCR_GPU):
+        self.languages = list(languages or OCR_LANGUAGES)
+        self.size = max(1, int(readers))
+        self.gpu = gpu
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._created
+
+    def _new_reader(self):
+        import easyocr
+        return easyocr.Reader(self.languages, gpu=self.gpu)
+
+    def _reserve(self):
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return True
+            return False
+
+    def _unreserve(self):
+        # Free the slot and wake one caller blocked in _acquire, which may
+        # have given up on building a reader because this one was on its way
+        with self._lock:
+            self._created -= 1
+        self._idle.put(_RETRY)
+
+    def _build(self):
+        try:
+            return self._new_reader()
+        except Exception:
+            self._unreserve()
+            raise
+
+    def _acquire(self):
+        while True:
+            try:
+                reader = self._idle.get_nowait()
+            except queue.Empty:
+                if self._reserve():
+                    return self._build()
+                reader = self._idle.get()
+            if reader is not _RETRY:
+                return reader
+
+    def _release(self, reader):
+        self._idle.put(reader)
+
+    def readtext(self, img, **kwargs):
+        reader = self._acquire()
+        try:
+            return reader.readtext(img, **kwargs)
+        finally:
+            self._release(reader)
+
+    def read_lines(self, img, min_confidence=MIN_CONFIDENCE):
+        return [text for (bbox, text, prob) in self.readtext(img) if prob >= min_confidence]
+
+    def warmup(self, readers=None, run_inference=True):
+        """Load up to ``readers`` readers (default: the whole pool) ahead of traffic."""
+        wanted = self.size if readers is None else min(int(readers), self.size)
+        while self._created < wanted and self._reserve():
+            reader = self._build()
+            if run_inference:
+                import numpy as np
+                try:
+                    # First call initialises the torch kernels; do it on a blank tile.
+                    reader.readtext(np.full((32, 32, 3), 255, dtype=np.uint8))
+                except Exception:
+                    self._unreserve()  # drop the reader so a later call can build a working one
+                    raise
+            self._release(reader)
+        return self._created
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = OCREngine()
+    return _engine
+
+
+def read_lines(img, min_confidence=MIN_CONFIDENCE):
+    return get_engine().read_lines(img, min_confidence)
+
+
+def warmup(readers=None):
+    return get_engine().warmup(readers)
@@ -1,71 +1,94 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import ast
-from io import BytesIO
 import base64
-import matplotlib.patches as mpatches
+import threading
+import numpy as np
+from cohort import CohortStats
+from cohort_store import get_cohort_store
+from cohort_sketches import get_cohort_sketches
+from neighbours import get_neighbour_index
+from render import get_renderer
+from tracing import stage
 
 
-demo_user_data_path = 'user_data/demo_user_data.csv'
 MIN_DATA_COUNT = 10
 
-def load_latest_df():
-    df = pd.read_csv(demo_user_data_path)
-    df['Conditions'] = df['Conditions'].apply(ast.literal_eval)
-    return df
-
-def generate_condition_plot(filtered_df, title, user_conditions):
-    
-    
-    if len(filtered_df) < MIN_DATA_COUNT:
-        return None, f"[Skipped] Not enough data for: {title} (only {len(filtered_df)+1} users)"
-
-    condition_counts = filtered_df['Conditions'].explode().value_counts()
-    condition_percent = (condition_counts / len(filtered_df)) * 100
-    condition_percent = condition_percent.sort_values(ascending=True)
-
-    plt.figure(figsize=(10, 6))
-    colors = ['yellow' if cond in user_conditions else 'skyblue' for cond in condition_percent.index]
-    condition_percent.plot(kind='barh', color=colors)
-    plt.xlabel("Percentage of Users (%)")
-    plt.title(title)
-
-    for i, v in enumerate(condition_percent):
-        plt.text(v + 0.5, i, f'{v:.1f}%', va='center')
-
-    
-    yellow_patch = mpatches.Patch(color='yellow', label='Your Condition')
-    blue_patch = mpatches.Patch(color='skyblue', label='Other Conditions')
-    plt.legend(handles=[yellow_patch, blue_patch], loc='lower right')
-
-    plt.tight_layout()
-    img = BytesIO()
-    plt.savefig(img, format='png')
-    plt.close()
-    img.seek(0)
-    encoded = base64.b64encode(img.getvalue()).decode()
-    return f"data:image/png;base64,{encoded}", None
-
-def generate_home_plots(age, gender, weight, user_conditions):
-   
-
-    df = load_latest_df() 
-
+_cohort_stats = None
+_cohort_lock = threading.Lock()
+
+def get_cohort_stats(store=None):
+    """Cohort prevalence tables, built from the cohort store on first use and
+    brought up to date with its row count."""
+    global _cohort_stats
+    store = (store or get_cohort_store()).refresh()
+    if _cohort_stats is None or not _cohort_stats.covers(store):  # first use, or the store was rebuilt
+        with _cohort_lock:
+            if _cohort_stats is None or not _cohort_stats.covers(store):
+                _cohort_stats = CohortStats(store.meta.get("id"))
+    _cohort_stats.sync(store)
+    return _cohort_stats
+
+def record_signup(person):
+    """Add a new user to the cohort store and fold it into this worker's prevalence
+    tables, quantile sketches and neighbour index; other workers catch up on their next read."""
+    store = get_cohort_store()
+    store.append([{"ID": person.id, "Age": person.age, "Gender": person.gender,
+                                "Weight": person.weight, "Height": person.height,
+                                "Conditions": list(person.conditions), "Registered": True}])
+    get_cohort_stats(store)
+    get_cohort_sketches(store)
+    get_neighbour_index(store)
+
+def to_data_uri(image):
+    return f"data:image/png;base64,{base64.b64encode(image).decode()}"
+
+def condition_plot_job(n_users, condition_counts, title, user_conditions):
+    if n_users < MIN_DATA_COUNT:
+        return None, f"[Skipped] Not enough data for: {title} (only {n_users+1} users)"
+
+    condition_percent = sorted(
+        ((cond, count / n_users * 100) for cond, count in condition_counts.items()),
+        key=lambda item: item[1])
+
+    data = {
+        "labels": [str(c) for c, _ in condition_percent],
+        "values": [float(v) for _, v in condition_percent],
+        "highlight": [str(c) for c in user_conditions],
+        "title": title,
+    }
+    return ("condition_barh", data), None
+
+def neighbour_plot_job(store, rows, user_conditions):
+    """Condition chart of the users at ``rows`` of the cohort store."""
+    bits = store.column("Conditions")[rows]
+    counts = {}
+    for i, name in enumerate(store.conditions):
+        n = int(np.count_nonzero(bits & np.uint32(1 << i)))
+        if n:
+            counts[name] = n
+    return condition_plot_job(len(rows), counts, f"Conditions for the {len(rows)} Users Most Like You", user_conditions)
+
+def generate_home_plots(age, gender, weight, height, user_conditions, user_id=None, stats=None, store=None):
+    store = store or get_cohort_store()
+    stats = stats or get_cohort_stats(store)
+
+    with stage("cohort_prevalence"):
+        jobs = [
+            condition_plot_job(*stats.prevalence("age", age), f"Conditions for Users with Age = {age}", user_conditions),
+            condition_plot_job(*stats.prevalence("gender", gender), f"Conditions for Users with Gender = {gender}", user_conditions),
+        ]
+    # Exact weight matches are nearly always too few; compare with the most similar users instead
+    with stage("neighbours"):
+        rows = get_neighbour_index(store).query(float(age), height, weight, gender, store.condition_mask(user_conditions),
+                                                exclude_id=user_id)
+        jobs.append(neighbour_plot_job(store, rows, user_conditions))
+
+    # The three charts are drawn in parallel by the render workers
+    images = iter(get_renderer().render_many([job for job, _ in jobs if job is not None]))
     plots = []
-    
-    same_age_df = df[df['Age'].astype(int) == int(age)]
-
-    age_plot, age_msg = generate_condition_plot(same_age_df, f"Conditions for Users with Age = {age}", user_conditions)
-    plots.append((age_plot, age_msg))
-
-    same_gender_df = df[df['Gender'].str.lower() == gender.lower()]
-    gender_plot, gender_msg = generate_condition_plot(same_gender_df, f"Conditions for Users with Gender = {gender}", user_conditions)
-    plots.append((gender_plot, gender_msg))
-
-    same_weight_df = df[df['Weight'] == weight]
-    weight_plot, weight_msg = generate_condition_plot(same_weight_df, f"Conditions for Users with Weight = {weight}", user_conditions)
-    plots.append((weight_plot, weight_msg))
-    
+    for job, msg in jobs:
+        if job is None:
+            plots.append((None, msg))
+        else:
+            image, timings = next(images)
+            plots.append((to_data_uri(image), None))
 
     return plots
-
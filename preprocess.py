@@ -0,0 +1,131 @@
+import io
+import os
+import time
+import numpy as np
+from PIL import Image, ImageOps
+from rapidfuzz import fuzz
+
+# Every step can be switched off; defaults keep recall while cutting pixels.
+PREPROCESS_STEPS = {
+    "exif": os.getenv("PREPROCESS_EXIF", "1") == "1",            # apply EXIF orientation
+    "grayscale": os.getenv("PREPROCESS_GRAYSCALE", "1") == "1",
+    "max_side": int(os.getenv("PREPROCESS_MAX_SIDE", "1600")),   # 0 keeps the original size
+    "contrast": os.getenv("PREPROCESS_CONTRAST", "0") == "1",    # autocontrast
+    "crop_panel": os.getenv("PREPROCESS_CROP_PANEL", "0") == "1",  # keep only the "Ingredients:" panel
+}
+PANEL_PROBE_SIDE = 800   # size of the low-res copy searched for the panel heading
+PANEL_MARGIN = 0.02      # extra border around the panel, as a fraction of the image side
+PANEL_HEADING = "ingredients"
+
+
+def _open(img):
+    if isinstance(img, Image.Image):
+        return img
+    if isinstance(img, np.ndarray):
+        return Image.fromarray(img)
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(img))  # an upload, decoded without touching the disk
+    return Image.open(img)
+
+
+def _downscale(image, max_side):
+    if max_side and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def find_panel(image, reader=None):
+    """Box ``(left, top, right, bottom)`` from the "Ingredients" heading to the
+    bottom-right of the image, or ``None`` when no heading is found."""
+    import ocr
+    probe = _downscale(image, PANEL_PROBE_SIDE)
+    scale = image.size[0] / probe.size[0]
+    results = (reader or ocr.get_engine()).readtext(np.asarray(probe))
+    for bbox, text, prob in results:
+        if fuzz.partial_ratio(PANEL_HEADING, text.lower()) >= 85:
+            xs = [p[0] for p in bbox]
+            ys = [p[1] for p in bbox]
+            margin = PANEL_MARGIN * max(image.size)
+            left = max(0, int(min(xs) * scale - margin))
+            top = max(0, int(min(ys) * scale - margin))
+            return left, top, image.size[0], image.size[1]
+    return None
+
+
+def preprocess(img, steps=None, reader=None):
+    """Prepare an image for OCR.
+
+    ``img`` may be a path, encoded image bytes, file object, PIL image or
+    array. Returns the processed image as a NumPy array and a dict of
+    milliseconds per step.
+    """
+    steps = {**PREPROCESS_STEPS, **(steps or {})}
+    timings = {}
+
+    start = time.perf_counter()
+    image = _open(img)
+    if steps["max_side"] and getattr(image, "format", None) == "JPEG":
+        # let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers max_side
+        image.draft("L" if steps["grayscale"] else "RGB", (steps["max_side"], steps["max_side"]))
+    image.load()
+    timings["decode"] = (time.perf_counter() - start) * 1000
+
+    def step(name, fn):
+        nonlocal image
+        t = time.perf_counter()
+        image = fn(image)
+        timings[name] = (time.perf_counter() - t) * 1000
+
+    if steps["exif"]:
+        step("exif", ImageOps.exif_transpose)
+    if steps["grayscale"]:
+        step("grayscale", lambda im: im.convert("L"))
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if steps["max_side"]:
+        step("downscale", lambda im: _downscale(im, steps["max_side"]))
+    if steps["contrast"]:
+        step("contrast", lambda im: ImageOps.autocontrast(im, cutoff=1))
+    if steps["crop_panel"]:
+        def crop(im):
+            box = find_panel(im, reader)
+            return im.crop(box) if box else im
+        step("crop_panel", crop)
+
+    return np.asarray(image), timings
+
+
+if __name__ == "__main__":
+    # Compare OCR latency and recall with and without preprocessing on the
+    # bundled sample labels.
+    import glob
+    import ocr
+    from scanner import match_ingredients
+
+    base_dir = os.path.abspath(os.path.dirname(__file__))
+    samples = sorted(glob.glob(os.path.join(base_dir, 'updated_ingredients_conditions', '*.jp*g')))
+    configs = {
+        "raw": {"exif": False, "grayscale": False, "max_side": 0, "contrast": False, "crop_panel": False},
+        "default": {},
+        "contrast": {"contrast": True},
+        "crop_panel": {"contrast": True, "crop_panel": True},
+    }
+
+    engine = ocr.get_engine()
+    engine.warmup()
+    for path in samples:
+        print(os.path.basename(path))
+        baseline = None
+        for label, config in configs.items():
+            array, timings = preprocess(path, config, reader=engine)
+            t = time.perf_counter()
+            lines = engine.read_lines(array)
+            ocr_ms = (time.perf_counter() - t) * 1000
+            found = set(match_ingredients(lines))
+            if baseline is None:
+                baseline = found
+            recall = len(found & baseline) / len(baseline) if baseline else 1.0
+            steps = ", ".join(f"{k} {v:.0f}ms" for k, v in timings.items())
+            print(f"  {label:<11} {array.shape[1]}x{array.shape[0]}  ocr {ocr_ms:.0f}ms  "
+                  f"found {len(found)}  recall vs raw {recall:.0%}  [{steps}]")
@@ -0,0 +1,131 @@
+import os
+import ast
+import threading
+import ingredient_db
+from cache import TTLCache, MISSING
+from user_store import get_repository
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1024"))
+# Profiles changed by another worker are picked up after at most this many seconds
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+
+
+class Profile:
+    """A registered user, parsed once from its stored record.
+
+    Its conditions are turned into a bitmask over the ingredient table's
+    condition columns on the first ``checkeffect``. Cached profiles are
+    shared by all requests of a worker, so treat them as read-only.
+    """
+
+    __slots__ = ("name", "id", "age", "password", "conditions", "gender",
+                 "weight", "height", "bmi", "bmi_category", "_condition_mask")
+
+    def __init__(self, name, id, age, password, conditions, gender, weight, height):
+        self.name = name
+        self.id = id
+        self.age = age
+        self.password = password
+        self.conditions = tuple(conditions)
+        self.gender = gender
+        self.weight = float(weight)  # assuming weight in kg
+        self.height = float(height)  # assuming height in cm
+        self.bmi = self.calculate_bmi()
+        self.bmi_category = self.get_bmi_category()
+        self._condition_mask = None
+
+    @classmethod
+    def from_record(cls, row):
+        return cls(row['Username'], row['ID'], row['Age'], row['Password'], ast.literal_eval(row['Conditions']),
+                   row['Gender'], row['Weight'], row['Height'])
+
+    def record(self):
+        return {
+            "Username": self.name,
+            "ID": self.id,
+            "Age": int(self.age),
+            "Password": self.password,
+            # Save conditions as a proper list string for correct parsing later
+            "Conditions": str(list(self.conditions)),
+            "Gender": self.gender,
+            "Weight": self.weight,
+            "Height": self.height
+        }
+
+    def calculate_bmi(self):
+        height_m = self.height / 100  # convert cm to meters
+        bmi = self.weight / (height_m ** 2)
+        return round(bmi, 2)
+
+    def get_bmi_category(self):
+        bmi = self.bmi
+        if bmi < 18.5:
+            return "Underweight"
+        elif 18.5 <= bmi < 25:
+            return "Normal weight"
+        elif 25 <= bmi < 30:
+            return "Overweight"
+        else:
+            return "Obese"
+
+    def checkeffect(self, matchedlist):
+        table = ingredient_db.current().table
+        # the mask is tied to the table version it was built for
+        mask = self._condition_mask
+        if mask is None or mask[0] is not table:
+            mask = self._condition_mask = (table, table.condition_mask(self.conditions))
+        return table.check(mask[1], matchedlist)
+
+
+class ProfileCache:
+    """Bounded per-worker cache of parsed profiles in front of a user repository."""
+
+    def __init__(self, repository, maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.repository = repository
+        self._cache = TTLCache(maxsize, ttl)
+
+    def get(self, user_id):
+        """The profile of ``user_id``, or ``None`` if there is no such user."""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        profile = self._cache.get(user_id)
+        if profile is MISSING:
+            row = self.repository.get(user_id)
+            if row is None:
+                return None
+            profile = Profile.from_record(row)
+            self._cache.put(user_id, profile)
+        return profile
+
+    def add(self, profile):
+        """Store a new profile; returns it with its allocated ID."""
+        record = profile.record()
+        del record["ID"]
+        profile.id = self.repository.add(record)
+        self._cache.put(profile.id, profile)
+        return profile
+
+    def remove(self, user_id):
+        self.repository.remove(user_id)
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id):
+        self._cache.pop(int(user_id))
+
+    def stats(self):
+        return self._cache.stats()
+
+
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def get_profiles():
+    global _profiles
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = ProfileCache(get_repository())
+    return _profiles
@@ -0,0 +1,92 @@
+import math
+import random
+import numpy as np
+
+KLL_K = 200        # accuracy parameter: rank error around 1.7 / K
+KLL_DECAY = 2 / 3  # capacity ratio between one level and the one above it
+
+
+class KLLSketch:
+    """Streaming quantile sketch (Karnin, Lang and Liberty's KLL).
+
+    Keeps O(K) values whatever the stream length. Level ``h`` holds values
+    that each stand for ``2 ** h`` inputs; a full level is sorted and every
+    other value (from a random offset) moves up, so ranks stay unbiased.
+    Single ``update`` calls append to a small buffer and cost O(1) amortized.
+    """
+
+    def __init__(self, k=KLL_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self._buffer = []
+        self._rng = random.Random(seed)
+
+    def __len__(self):
+        return self.n
+
+    def _capacity(self, h):
+        return max(2, math.ceil(self.k * KLL_DECAY ** (len(self.levels) - h - 1)))
+
+    def update(self, value):
+        value = float(value)
+        if value != value:  # NaN
+            return
+        self._buffer.append(value)
+        self.n += 1
+        if len(self._buffer) >= self._capacity(0):
+            self._flush()
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) < 16:
+            for value in values.tolist():
+                self.update(value)
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+    def _flush(self):
+        if self._buffer:
+            self.levels[0] = np.concatenate([self.levels[0], self._buffer])
+            self._buffer = []
+        self._compress()
+
+    def _compress(self):
+        while True:
+            for h, level in enumerate(self.levels):
+                if len(level) >= self._capacity(h):
+                    break
+            else:
+                return
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            level = np.sort(level)
+            keep = level[:1] if len(level) % 2 else level[:0]  # an odd value out stays put
+            pairs = level[len(keep):]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], pairs[self._rng.getrandbits(1)::2]])
+
+    def rank(self, value):
+        """Fraction of the stream below ``value`` (ties count half), or ``None`` if empty."""
+        self._flush()
+        if not self.n:
+            return None
+        below = 0.0
+        for h, level in enumerate(self.levels):
+            below += (np.count_nonzero(level < value) + 0.5 * np.count_nonzero(level == value)) * 2 ** h
+        return below / self.n
+
+    def to_arrays(self):
+        """``[n, level 0, level 1, ...]`` as float arrays, for ``np.savez``."""
+        self._flush()
+        return [np.array([self.n], dtype=float)] + [level.copy() for level in self.levels]
+
+    @classmethod
+    def from_arrays(cls, arrays, k=KLL_K, seed=None):
+        sketch = cls(k, seed)
+        sketch.n = int(arrays[0][0])
+        sketch.levels = [np.asarray(level, dtype=float) for level in arrays[1:]] or [np.empty(0)]
+        return sketch
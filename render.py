@@ -0,0 +1,293 @@
+import os
+import io
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+import tracing
+from tracing import stage
+
+# Charts are drawn with matplotlib's object API (Figure + Agg canvas), never
+# pyplot, so no global figure state is shared between requests.
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))  # 0 renders in the calling process
+
+BMI_CATEGORIES = ["Underweight", "Normal", "Overweight", "Obese"]
+BMI_COLORS = ['#5DADE2', '#58D68D', '#F4D03F', '#E74C3C']
+
+
+def _new_figure(figsize, dpi=100):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+class BMIBarTemplate:
+    """BMI category bars: the four bars and labels are built once and only
+    their heights, texts and the title change per chart."""
+
+    savefig_kwargs = {}
+
+    def __init__(self):
+        self.fig = _new_figure((6.4, 4.8))
+        self.ax = self.fig.add_subplot()
+        self.bars = self.ax.bar(BMI_CATEGORIES, [0] * len(BMI_CATEGORIES), color=BMI_COLORS)
+        self.ax.set_ylabel('Percentage (%)')
+        self.ax.set_ylim(0, 100)
+        self.labels = self.ax.bar_label(self.bars, fmt='%.1f%%')
+        self.ax.set_title("BMI by Gender: Female")
+        self.fig.tight_layout()
+
+    def update(self, data):
+        for bar, label, value in zip(self.bars, self.labels, data["percentages"]):
+            bar.set_height(value)
+            label.xy = (label.xy[0], value)
+            label.set_text(f"{value:.1f}%")
+        self.ax.set_title(data["title"])
+
+
+class ConditionBarTemplate:
+    """Horizontal condition-prevalence bars. Bars and value labels are kept
+    and reused, more being added when a chart has more conditions than any
+    before; the layout is only recomputed when the longest label changes."""
+
+    savefig_kwargs = {}
+
+    def __init__(self):
+        import matplotlib.patches as mpatches
+        self.fig = _new_figure((10, 6))
+        self.ax = self.fig.add_subplot()
+        self.ax.set_ylabel("Conditions")
+        self.ax.set_xlabel("Percentage of Users (%)")
+        self.ax.legend(handles=[
+            mpatches.Patch(color='yellow', label='Your Condition'),
+            mpatches.Patch(color='skyblue', label='Other Conditions'),
+        ], loc='lower right')
+        self.bars = []
+        self.texts = []
+        self._layout = None
+
+    def _grow(self, n):
+        while len(self.bars) < n:
+            i = len(self.bars)
+            self.bars.append(self.ax.barh([i], [0])[0])
+            self.texts.append(self.ax.text(0, i, "", va='center'))
+
+    def update(self, data):
+        ax = self.ax
+        labels = data["labels"]
+        values = data["values"]
+        highlight = set(data.get("highlight", ()))
+        n = len(labels)
+        self._grow(n)
+        for i, (bar, text) in enumerate(zip(self.bars, self.texts)):
+            bar.set_visible(i < n)
+            text.set_visible(i < n)
+            if i < n:
+                bar.set_width(values[i])
+                bar.set_color('yellow' if labels[i] in highlight else 'skyblue')
+                text.set_position((values[i] + 0.5, i))
+                text.set_text(f'{values[i]:.1f}%')
+        ax.set_yticks(range(n), labels)
+        # the limits autoscaling would pick for these bars
+        margin = 0.05 * max(n - 0.2, 0)
+        ax.set_ylim(-0.4 - margin, n - 0.6 + margin) if n else ax.set_ylim(-1, 1)
+        ax.set_xlim(0, 1.05 * max(values) if n and max(values) > 0 else 1)
+        ax.set_title(data["title"])
+        layout = max(labels, key=len, default="")
+        if layout != self._layout:
+            self.fig.tight_layout()
+            self._layout = layout
+
+
+class NutrientPieTemplate:
+    """Nutrient pie with the legend on the right. Wedges and their labels are
+    kept and updated in place, and the axes and legend sit at fixed positions
+    so a chart is drawn in one pass."""
+
+    savefig_kwargs = {"dpi": 150}
+
+    def __init__(self):
+        self.fig = _new_figure((15, 10), dpi=150)
+        self.ax = self.fig.add_axes((0.02, 0.04, 0.58, 0.86))
+        self.ax.set(frame_on=False, xticks=[], yticks=[], xlim=(-1.25, 1.25), ylim=(-1.25, 1.25), aspect='equal')
+        self.wedges = []
+        self.labels = []
+        self.pcts = []
+        self.legend = None
+
+    def _grow(self, n):
+        from matplotlib.patches import Wedge
+        while len(self.wedges) < n:
+            i = len(self.wedges)
+            self.wedges.append(self.ax.add_patch(Wedge((0, 0), 1, 0, 0, facecolor=f"C{i % 10}")))
+            self.labels.append(self.ax.text(0, 0, "", va='center', fontsize=12))
+            self.pcts.append(self.ax.text(0, 0, "", ha='center', va='center', fontsize=12))
+
+    def update(self, data):
+        import math
+        labels = data["labels"]
+        sizes = data["sizes"]
+        total = sum(sizes)
+        n = len(labels) if total > 0 else 0
+        self._grow(n)
+
+        # Same geometry as ax.pie(startangle=90): counter-clockwise from the top
+        angle = 90.0
+        for i, (wedge, label, pct) in enumerate(zip(self.wedges, self.labels, self.pcts)):
+            for artist in (wedge, label, pct):
+                artist.set_visible(i < n)
+            if i >= n:
+                continue
+            share = sizes[i] / total
+            wedge.set_theta1(angle)
+            wedge.set_theta2(angle + 360 * share)
+            middle = math.radians(angle + 180 * share)
+            x, y = math.cos(middle), math.sin(middle)
+            label.set_position((1.1 * x, 1.1 * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            label.set_text(labels[i] if share * 100 >= 3 else '')
+            pct.set_position((0.6 * x, 0.6 * y))
+            pct.set_text(f'{share * 100:.1f}%' if share * 100 >= 3 else '')
+            angle += 360 * share
+
+        if self.legend is not None:
+            self.legend.remove()
+        self.legend = self.fig.legend(
+            self.wedges[:n], [f'{k}: {v:.2f}g' for k, v in zip(labels, sizes)],
+            loc='center left', bbox_to_anchor=(0.62, 0.47), fontsize=14, frameon=False)
+        self.ax.set_title(data["title"], fontsize=16)
+
+
+TEMPLATES = {
+    "bmi_bar": BMIBarTemplate,
+    "condition_barh": ConditionBarTemplate,
+    "nutrient_pie": NutrientPieTemplate,
+}
+
+CHART_STAGES = {"template": "chart_template", "update": "chart_update", "render": "chart_draw", "wait": "chart_wait"}
+
+_templates = {}  # per process: chart kind -> template
+_inline_lock = threading.Lock()
+
+
+def render_chart(kind, data, fmt="png"):
+    """Draw one chart in this process and return ``(image bytes, timings in ms)``."""
+    t0 = time.perf_counter()
+    template = _templates.get(kind)
+    if template is None:
+        template = _templates[kind] = TEMPLATES[kind]()
+    t1 = time.perf_counter()
+    template.update(data)
+    t2 = time.perf_counter()
+    buf = io.BytesIO()
+    template.fig.savefig(buf, format=fmt, **template.savefig_kwargs)
+    t3 = time.perf_counter()
+    timings = {"template": (t1 - t0) * 1000, "update": (t2 - t1) * 1000, "render": (t3 - t2) * 1000}
+    return buf.getvalue(), timings
+
+
+def _warm_templates():
+    for kind in TEMPLATES:
+        _templates[kind] = TEMPLATES[kind]()
+
+
+class ChartRenderer:
+    """Chart rendering service backed by a small process pool.
+
+    Each worker keeps one pre-built template per chart kind. ``submit``
+    returns a future of ``(bytes, timings)``; ``render_many`` draws several
+    charts for one page in parallel.
+    """
+
+    def __init__(self, workers=CHART_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_warm_templates,
+                    )
+        return self._executor
+
+    def submit(self, kind, data, fmt="png"):
+        submitted = time.perf_counter()
+        if self.workers <= 0:
+            future = Future()
+            try:
+                with _inline_lock:
+                    future.set_result(render_chart(kind, data, fmt))
+            except Exception as e:
+                future.set_exception(e)
+            inner = future
+        else:
+            inner = self._get_executor().submit(render_chart, kind, data, fmt)
+
+        outer = Future()
+
+        def done(f):
+            try:
+                image, timings = f.result()
+            except Exception as e:
+                outer.set_exception(e)
+                return
+            timings["total"] = (time.perf_counter() - submitted) * 1000
+            timings["wait"] = timings["total"] - timings["template"] - timings["update"] - timings["render"]
+            outer.set_result((image, timings))
+        inner.add_done_callback(done)
+        return outer
+
+    @staticmethod
+    def _record(results):
+        # Worker-side steps as stages of the calling request (summed over its charts)
+        for image, timings in results:
+            for step in ("template", "update", "render", "wait"):
+                tracing.record(CHART_STAGES[step], timings[step] / 1000)
+        return results
+
+    def render(self, kind, data, fmt="png"):
+        with stage("chart_render"):
+            return self._record([self.submit(kind, data, fmt).result()])[0]
+
+    def render_many(self, jobs, fmt="png"):
+        """Render ``[(kind, data), ...]`` in parallel; results keep the job order."""
+        if not jobs:
+            return []
+        with stage("chart_render"):
+            futures = [self.submit(kind, data, fmt) for kind, data in jobs]
+            return self._record([f.result() for f in futures])
+
+    def warmup(self):
+        """Start the worker processes (which build their templates) ahead of traffic."""
+        if self.workers <= 0:
+            with _inline_lock:
+                _warm_templates()
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = ChartRenderer()
+    return _renderer
@@ -0,0 +1,136 @@
+import os
+import threading
+import ocr
+from cache import DiskCache, MISSING
+import ingredient_db
+import tracing
+from tracing import stage
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+SCAN_CACHE_PATH = os.getenv("SCAN_CACHE_PATH", os.path.join(base_dir, 'cache', 'scans.sqlite3'))
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", "5000"))
+
+
+def get_phrases(words, max_n=3):
+    return [' '.join(words[i:i+n]) for n in range(1, max_n+1) for i in range(len(words)-n+1)]
+
+
+def normalize_text(raw_lines):
+    text_block = " ".join(raw_lines)
+    text = text_block.lower()
+    text = text.replace("(", " ").replace(")", " ")
+    text = ''.join([c if c.isalpha() or c.isspace() else ' ' for c in text])
+    return text
+
+
+def match_ingredients(raw_lines, index=None):
+    words = normalize_text(raw_lines).split()
+    index = index or ingredient_db.current().index
+
+    # Exact names in one pass; only text they leave uncovered is fuzzy matched
+    with stage("exact_scan"):
+        found, spans = index.scan(words)
+    with stage("phrases"):
+        phrases = set()
+        for span in spans:
+            phrases.update(get_phrases(span))
+    with stage("fuzzy_match"):
+        return list(found | index.match(phrases))
+
+
+def match_ingredient_lists(ingredient_lists, index=None):
+    """``match_ingredients`` for many structured lists at once.
+
+    Each entry is a list of ingredient strings (or one free-text string).
+    Items are matched separately so phrases never span two ingredients, and
+    the fuzzy step runs once for the whole batch.
+    """
+    index = index or ingredient_db.current().index
+    found_per_list = []
+    phrases_per_list = []
+    for items in ingredient_lists:
+        if isinstance(items, str):
+            items = [items]
+        found, phrases = set(), set()
+        for item in items:
+            item_found, spans = index.scan(normalize_text([str(item)]).split())
+            found |= item_found
+            for span in spans:
+                phrases.update(get_phrases(span))
+        found_per_list.append(found)
+        phrases_per_list.append(phrases)
+
+    all_phrases = set().union(*phrases_per_list) if phrases_per_list else set()
+    exact = {p for p in all_phrases if p in index.exact}
+    resolved = index.resolve(all_phrases - exact)
+    results = []
+    for found, phrases in zip(found_per_list, phrases_per_list):
+        matched = set(found)
+        for phrase in phrases:
+            if phrase in exact:
+                matched.add(phrase)
+            elif resolved.get(phrase) is not None:
+                matched.add(resolved[phrase])
+        results.append(sorted(matched))
+    return results
+
+
+def read_label(img):
+    from preprocess import preprocess  # PIL and numpy, only needed by OCR workers
+    array, timings = preprocess(img)
+    for step, ms in timings.items():
+        tracing.record(f"preprocess_{step}", ms / 1000)
+    with stage("ocr"):
+        return ocr.read_lines(array)
+
+
+def scan_label(img):
+    """OCR an ingredient label and return the ingredient names found on it.
+
+    Module-level so it can be shipped to a worker process by ``jobs``.
+    """
+    return match_ingredients(read_label(img))
+
+
+_scan_cache = None
+_scan_cache_lock = threading.Lock()
+
+
+def get_scan_cache():
+    """image hash -> {"lines": OCR text lines, "matched": ingredient names, "version": table version}"""
+    global _scan_cache
+    if _scan_cache is None:
+        with _scan_cache_lock:
+            if _scan_cache is None:
+                _scan_cache = DiskCache(SCAN_CACHE_PATH, SCAN_CACHE_SIZE)
+    return _scan_cache
+
+
+def loaded_scan_cache():
+    """The scan cache if this worker has opened it, else ``None``; never creates the file."""
+    return _scan_cache
+
+
+def cached_scan(digest):
+    """Matched ingredients of an already scanned image, or ``None``.
+
+    Results matched against an older ingredient table are re-matched from
+    the stored OCR lines, so a table update never needs another OCR pass.
+    """
+    entry = get_scan_cache().get(digest)
+    if entry is MISSING:
+        return None
+    snapshot = ingredient_db.current()
+    if entry.get("version") != snapshot.version:
+        entry = {"lines": entry["lines"], "matched": match_ingredients(entry["lines"], snapshot.index),
+                 "version": snapshot.version}
+        get_scan_cache().put(digest, entry)
+    return entry["matched"]
+
+
+def scan_and_cache(img, digest):
+    lines = read_label(img)
+    snapshot = ingredient_db.current()
+    matched = match_ingredients(lines, snapshot.index)
+    get_scan_cache().put(digest, {"lines": lines, "matched": matched, "version": snapshot.version})
+    return matched
@@ -0,0 +1,213 @@
+import time
+
+STARTED = time.perf_counter()  # app.py imports this module first
+
+import os
+import sys
+import logging
+import threading
+import subprocess
+import multiprocessing
+import tracing
+
+# Subsystems loaded in the background when a worker starts; /ready answers 503 until they are
+WARMUP = [name.strip() for name in os.getenv("WARMUP", "").split(",") if name.strip()]
+if os.getenv("OCR_WARMUP", "0") == "1" and "ocr" not in WARMUP:
+    WARMUP.append("ocr")
+
+# Reported when already imported at startup: each costs from tens of ms to seconds
+HEAVY_MODULES = ("pandas", "matplotlib", "rapidfuzz", "PIL", "requests", "scipy", "easyocr", "torch")
+
+logger = logging.getLogger(__name__)
+
+
+def _ingredients():
+    import ingredient_db
+    ingredient_db.current()
+
+
+def _cohort():
+    from plots import get_cohort_stats
+    from cohort_store import get_cohort_store
+    from cohort_sketches import get_cohort_sketches
+    from neighbours import get_neighbour_index
+    get_cohort_stats()
+    get_cohort_sketches(get_cohort_store())
+    get_neighbour_index(get_cohort_store())
+
+
+def _charts():
+    from render import get_renderer
+    get_renderer().warmup()
+
+
+def _ocr():
+    import ocr
+    import jobs
+    for future in jobs.get_queue().warmup(ocr.warmup):
+        future.result()
+
+
+def _usda():
+    from nutrition import USDA_API_KEY
+    from usda import get_client
+    from food_index import get_food_index
+    get_client(USDA_API_KEY)
+    index = get_food_index()
+    if index is not None:
+        len(index)  # opens this thread's connection and pages in the table
+
+
+WARMERS = {
+    "ingredients": _ingredients,  # ingredient table and fuzzy index
+    "cohort": _cohort,            # cohort store, prevalence tables, quantile sketches, neighbour index
+    "charts": _charts,            # chart rendering processes
+    "ocr": _ocr,                  # EasyOCR models in the scan workers
+    "usda": _usda,                # FoodData Central client, caches and local food index
+}
+
+
+def heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+class Warmup:
+    """Loads subsystems ahead of traffic and remembers what each one cost."""
+
+    def __init__(self, warmers=WARMERS):
+        self.warmers = warmers
+        self.seconds = {}   # subsystem -> seconds its warmup took
+        self.errors = {}
+        self.pending = set()
+        self._lock = threading.Lock()  # one warmup at a time
+
+    def run(self, names):
+        unknown = [name for name in names if name not in self.warmers]
+        if unknown:
+            raise ValueError(f"Unknown subsystems {', '.join(unknown)} (choose from {', '.join(self.warmers)})")
+        with self._lock:
+            for name in names:
+                if name in self.seconds:
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    self.warmers[name]()
+                except Exception as e:
+                    logger.exception("Warming up %s failed", name)
+                    self.errors[name] = str(e)
+                    continue
+                self.seconds[name] = time.perf_counter() - t0
+                self.errors.pop(name, None)
+                logger.info("Warmed up %s in %.0f ms", name, self.seconds[name] * 1000)
+        return {name: self.seconds.get(name) for name in names}
+
+    def start(self, names):
+        """Warm ``names`` up on a background thread."""
+        names = [name for name in names if name not in self.seconds]
+        if not names or multiprocessing.parent_process() is not None:  # e.g. OCR_WARMUP in a spawned OCR worker
+            return
+        self.pending.update(names)
+
+        def work():
+            try:
+                self.run(names)
+            finally:
+                self.pending.difference_update(names)
+        threading.Thread(target=work, name="warmup", daemon=True).start()
+
+    def ready(self, names=()):
+        return not self.pending and all(name in self.seconds for name in names)
+
+
+_warmup = Warmup()
+_startup_seconds = None
+_finish_lock = threading.Lock()
+
+
+def report():
+    return {
+        "ready": _startup_seconds is not None and _warmup.ready(WARMUP),
+        "startup_ms": None if _startup_seconds is None else round(_startup_seconds * 1000, 1),
+        "heavy_modules": heavy_modules(),
+        "warm": {name: round(seconds * 1000, 1) for name, seconds in _warmup.seconds.items()},
+        "warming": sorted(_warmup.pending),
+        "errors": dict(_warmup.errors),
+    }
+
+
+def finish():
+    """Mark the app as ready to serve: log the startup time and start the ``WARMUP`` subsystems.
+
+    Called once the server is about to serve, never at import: spawned
+    chart and OCR processes import the app too and must not warm up (and
+    start their own pools) again.
+    """
+    global _startup_seconds
+    if _startup_seconds is not None or multiprocessing.parent_process() is not None:
+        return
+    with _finish_lock:
+        if _startup_seconds is not None:
+            return
+        _startup_seconds = time.perf_counter() - STARTED
+    logger.info("Started in %.0f ms (heavy modules loaded: %s)", _startup_seconds * 1000,
+                ", ".join(heavy_modules()) or "none")
+    _warmup.start(WARMUP)
+
+
+@tracing.collected("app_startup_seconds", "Time from the first app import to serving.")
+def startup_seconds():
+    return {(): _startup_seconds} if _startup_seconds is not None else {}
+
+
+@tracing.collected("app_warmup_seconds", "Time spent warming up a subsystem.", labelnames=["subsystem"])
+def warmup_seconds():
+    return {(name,): seconds for name, seconds in _warmup.seconds.items()}
+
+
+def install(app):
+    """Serve ``/ready`` (readiness, startup report) and ``POST /warmup`` on a Flask ``app``."""
+    from flask import request, jsonify
+
+    @app.before_request
+    def serving():
+        # Under a WSGI server without a worker-start hook calling finish(), the first request does
+        finish()
+
+    @app.route('/ready')
+    def ready():
+        body = report()
+        return jsonify(body), 200 if body["ready"] else 503
+
+    @app.route('/warmup', methods=['POST'])
+    def warmup():
+        # ?subsystems=ocr,cohort; defaults to WARMUP, or everything when that is empty
+        names = [name for name in request.args.get("subsystems", "").split(",") if name]
+        try:
+            _warmup.run(names or WARMUP or list(WARMERS))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        body = report()
+        return jsonify(body), 500 if body["errors"] else 200
+
+
+if __name__ == "__main__":
+    # python startup.py [N]: the N slowest imports of a fresh worker
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    base_dir = os.path.abspath(os.path.dirname(__file__))
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=base_dir,
+                         capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if out.returncode:
+        sys.exit(out.stderr)
+    imports = []
+    for line in out.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative), name.rstrip()))
+    print(f"python -c 'import app': {elapsed * 1000:.0f} ms")
+    for cumulative, name in sorted(imports, reverse=True)[:top]:
+        print(f"{cumulative / 1000:8.1f} ms  {name}")
+    loaded = {name.strip().split(".")[0] for _, name in imports}
+    print("heavy modules loaded:", ", ".join(name for name in HEAVY_MODULES if name in loaded) or "none")
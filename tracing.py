@@ -0,0 +1,241 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import nullcontext
+
+TRACING = os.getenv("TRACING", "1") == "1"                       # 0 turns every timer into a no-op
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))   # requests slower than this are logged
+# Histogram buckets in seconds, from a fast cache hit to a cold OCR run
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', '+Inf')])} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Collected:
+    """Values read at scrape time from ``collect()``, which returns ``{label values: number}``."""
+
+    def __init__(self, name, help, kind, labelnames, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def expose(self):
+        try:
+            values = self.collect()
+        except Exception:
+            logger.exception("Collecting metric %s failed", self.name)
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+_metrics = []
+
+
+def register(metric):
+    _metrics.append(metric)
+    return metric
+
+
+def collected(name, help, kind="gauge", labelnames=()):
+    """Decorator registering a function as a scrape-time gauge or counter."""
+    def wrap(fn):
+        register(Collected(name, help, kind, labelnames, fn))
+        return fn
+    return wrap
+
+
+def expose():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = register(Histogram("app_stage_seconds", "Time spent in a named processing stage.", ["stage"]))
+request_seconds = register(Histogram("app_request_seconds", "HTTP request latency.", ["endpoint", "method", "status"]))
+slow_requests = register(Counter("app_slow_requests_total", "Requests slower than SLOW_REQUEST_MS.", ["endpoint"]))
+
+_trace = contextvars.ContextVar("trace", default=None)  # stage -> seconds for the current request
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _Collected(dict):
+    """Stages of a ``run_collected`` call, kept out of the histograms until the caller records them."""
+
+
+_NOOP = nullcontext()
+
+
+def stage(name):
+    """``with stage("ocr"): ...`` times the block into ``app_stage_seconds``."""
+    return _Stage(name) if TRACING else _NOOP
+
+
+def record(name, seconds):
+    """Add a stage duration measured elsewhere (e.g. in a worker process)."""
+    if not TRACING:
+        return
+    trace = _trace.get()
+    if type(trace) is not _Collected:
+        stage_seconds.observe(seconds, name)
+    if trace is not None:
+        trace[name] = trace.get(name, 0.0) + seconds
+
+
+def record_all(stages):
+    for name, seconds in stages.items():
+        record(name, seconds)
+
+
+def run_collected(fn, *args):
+    """Call ``fn(*args)`` and return ``(result, {stage: seconds})`` of the stages it ran.
+
+    Used for work shipped to another process, whose own histograms the web
+    process never sees; the caller passes the stages to ``record_all``.
+    """
+    token = _trace.set(_Collected())
+    try:
+        result = fn(*args)
+        return result, dict(_trace.get())
+    finally:
+        _trace.reset(token)
+
+
+def install(app):
+    """Time every request of a Flask ``app``, log slow ones and serve ``/metrics``."""
+    from flask import request, g, Response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(expose(), mimetype="text/plain; version=0.0.4")
+
+    if not TRACING:
+        return
+
+    from flask import before_render_template, template_rendered
+
+    def template_started(sender, template, context, **extra):
+        g.setdefault("template_starts", []).append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        starts = g.get("template_starts")
+        if starts:
+            record("template", time.perf_counter() - starts.pop())
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    @app.before_request
+    def start_trace():
+        g.trace_start = time.perf_counter()
+        g.trace_token = _trace.set({})
+
+    @app.after_request
+    def finish_trace(response):
+        start = g.pop("trace_start", None)
+        token = g.pop("trace_token", None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        stages = _trace.get() or {}
+        if token is not None:
+            _trace.reset(token)
+        endpoint = request.endpoint or "unknown"
+        request_seconds.observe(elapsed, endpoint, request.method, str(response.status_code))
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            slow_requests.inc(endpoint)
+            breakdown = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in
+                                  sorted(stages.items(), key=lambda item: -item[1]))
+            logger.warning("Slow request %s %s: %.0fms [%s]", request.method, request.path,
+                           elapsed * 1000, breakdown or "no stages")
+        return response
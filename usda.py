@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import TTLCache, DiskCache, MISSING
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+USDA_BASE_URL = os.getenv("USDA_BASE_URL", "https://api.nal.usda.gov/fdc/v1")
+USDA_TIMEOUT = float(os.getenv("USDA_TIMEOUT", "10"))       # seconds, per request
+USDA_RETRIES = int(os.getenv("USDA_RETRIES", "3"))
+USDA_POOL_SIZE = int(os.getenv("USDA_POOL_SIZE", "10"))
+USDA_MEMORY_TTL = float(os.getenv("USDA_MEMORY_TTL", "3600"))          # in-process cache, seconds
+USDA_DISK_TTL = float(os.getenv("USDA_DISK_TTL", str(30 * 86400)))     # on-disk cache, seconds
+USDA_CACHE_PATH = os.getenv("USDA_CACHE_PATH", os.path.join(base_dir, 'cache', 'usda.sqlite3'))
+USDA_FIXTURE_DIR = os.getenv("USDA_FIXTURE_DIR")  # serve canned responses instead of calling the API
+MEMORY_CACHE_SIZE = 2048
+DISK_CACHE_SIZE = 50000
+FOODS_BATCH_SIZE = 20  # the /foods endpoint accepts up to 20 fdcIds per call
+
+
+class USDAError(Exception):
+    pass
+
+
+def fixture_name(query):
+    return re.sub(r"[^a-z0-9]+", "_", query.strip().lower()).strip("_") or "_"
+
+
+class USDAClient:
+    """FoodData Central client with a pooled session and a two-tier cache.
+
+    Responses are kept in an in-memory TTL LRU and in a SQLite file shared by
+    all workers. With ``fixture_dir`` set, responses come from
+    ``<fixture_dir>/search/<query>.json`` and ``<fixture_dir>/food/<fdcId>.json``
+    and the network is never touched.
+    """
+
+    def __init__(self, api_key=None, base_url=USDA_BASE_URL, timeout=USDA_TIMEOUT, retries=USDA_RETRIES,
+                 pool_size=USDA_POOL_SIZE, cache_path=USDA_CACHE_PATH, fixture_dir=USDA_FIXTURE_DIR):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.fixture_dir = fixture_dir
+        self.memory = TTLCache(MEMORY_CACHE_SIZE, USDA_MEMORY_TTL)
+        self.disk = DiskCache(cache_path, DISK_CACHE_SIZE) if cache_path and not fixture_dir else None
+
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET", "POST"), respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _cached(self, key, fetch):
+        value = self.memory.get(key)
+        if value is not MISSING:
+            return value
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not MISSING and time.time() - entry["fetched"] < USDA_DISK_TTL:
+                self.memory.put(key, entry["data"])
+                return entry["data"]
+        value = fetch()
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, {"fetched": time.time(), "data": value})
+        return value
+
+    def _request(self, method, path, params=None, body=None):
+        params = dict(params or {})
+        params["api_key"] = self.api_key
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", params=params, json=body,
+                                            timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise USDAError(f"FoodData Central request failed: {e}") from e
+
+    def _fixture(self, kind, name):
+        path = os.path.join(self.fixture_dir, kind, f"{name}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def search(self, query, page_size=5):
+        key = f"search:{page_size}:{query.strip().lower()}"
+
+        def fetch():
+            if self.fixture_dir:
+                return self._fixture("search", fixture_name(query)) or {"foods": []}
+            return self._request("GET", "/foods/search", {"query": query, "pageSize": page_size})
+        return self._cached(key, fetch)
+
+    def food(self, fdc_id):
+        key = f"food:{fdc_id}"
+
+        def fetch():
+            if self.fixture_dir:
+                data = self._fixture("food", str(fdc_id))
+                if data is None:
+                    raise USDAError(f"No fixture for food {fdc_id}")
+                return data
+            return self._request("GET", f"/food/{fdc_id}")
+        return self._cached(key, fetch)
+
+    def foods(self, fdc_ids):
+        """Details for several foods, fetching all uncached ones in one request.
+
+        Returns a dict keyed by fdcId; ids the API does not know are left out.
+        """
+        results = {}
+        missing = []
+        for fdc_id in dict.fromkeys(fdc_ids):
+            key = f"food:{fdc_id}"
+            value = self.memory.get(key)
+            if value is MISSING and self.disk is not None:
+                entry = self.disk.get(key)
+                if entry is not MISSING and time.time() - entry["fetched"] < USDA_DISK_TTL:
+                    value = entry["data"]
+                    self.memory.put(key, value)
+            if value is MISSING:
+                missing.append(fdc_id)
+            else:
+                results[fdc_id] = value
+
+        if missing:
+            if self.fixture_dir:
+                fetched = [self._fixture("food", str(fdc_id)) for fdc_id in missing]
+            else:
+                fetched = []
+                for start in range(0, len(missing), FOODS_BATCH_SIZE):
+                    ids = missing[start:start + FOODS_BATCH_SIZE]
+                    fetched += self._request("POST", "/foods", body={"fdcIds": ids, "format": "full"})
+            by_id = {data["fdcId"]: data for data in fetched if data}
+            for fdc_id in missing:
+                data = by_id.get(fdc_id)
+                if data is None:
+                    continue
+                results[fdc_id] = data
+                self.memory.put(f"food:{fdc_id}", data)
+                if self.disk is not None:
+                    self.disk.put(f"food:{fdc_id}", {"fetched": time.time(), "data": data})
+        return results
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key=None):
+    """One shared client (and connection pool) per API key."""
+    client = _clients.get(api_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                client = _clients[api_key] = USDAClient(api_key)
+    return client
+
+
+if __name__ == "__main__":
+    # Stub FoodData Central server for offline testing and benchmarks:
+    #   python usda.py fixtures/usda 8765
+    #   USDA_BASE_URL=http://127.0.0.1:8765/fdc/v1 python app.py
+    import sys
+    from urllib.parse import urlparse, parse_qs
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    fixture_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base_dir, 'fixtures', 'usda')
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    stub = USDAClient(fixture_dir=fixture_dir, cache_path=None)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.endswith("/foods/search"):
+                query = parse_qs(url.query).get("query", [""])[0]
+                return self._send(200, stub.search(query))
+            if "/food/" in url.path:
+                try:
+                    return self._send(200, stub.food(url.path.rsplit("/", 1)[1]))
+                except USDAError:
+                    return self._send(404, {"error": "not found"})
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if not urlparse(self.path).path.endswith("/foods"):
+                return self._send(404, {"error": "not found"})
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            self._send(200, list(stub.foods(body.get("fdcIds", [])).values()))
+
+        def log_message(self, format, *args):
+            pass
+
+    print(f"Serving FoodData Central fixtures from {fixture_dir} on http://127.0.0.1:{port}/fdc/v1")
+    ThreadingHTTPServer(("127.0.0.1", port), StubHandler).serve_forever()
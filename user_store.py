@@ -0,0 +1,228 @@
+import os
+import sys
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+base_dir = os.path.abspath(os.path.dirname(__file__))
+user_data_path = os.path.join(base_dir, 'user_data', 'user_data.csv')
+USER_DB_PATH = os.getenv("USER_DB_PATH", os.path.join(base_dir, 'user_data', 'users.sqlite3'))
+USER_STORE = os.getenv("USER_STORE", "sqlite")  # "sqlite" or "csv" (legacy, single worker only)
+
+FIELDS = ["Username", "ID", "Age", "Password", "Conditions", "Gender", "Weight", "Height"]
+
+USERS_TABLE = """
+    CREATE TABLE {name} (
+        ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        Username TEXT NOT NULL,
+        Age INTEGER,
+        Password TEXT NOT NULL,
+        Conditions TEXT NOT NULL DEFAULT '[]',
+        Gender TEXT,
+        Weight REAL,
+        Height REAL
+    )"""
+
+
+class UserRepository(ABC):
+    """Storage for registered users.
+
+    Users are dicts with the ``FIELDS`` keys, ``Conditions`` being the list
+    string that routes parse with ``ast.literal_eval``.
+    """
+
+    @abstractmethod
+    def get(self, user_id):
+        """The user with ``user_id``, or ``None``."""
+
+    @abstractmethod
+    def add(self, user):
+        """Store ``user`` (without ``ID``) and return the ID allocated to it."""
+
+    @abstractmethod
+    def remove(self, user_id):
+        """Delete a user, e.g. one whose signup could not be completed."""
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+
+class SQLiteUserRepository(UserRepository):
+    """Users in a SQLite database in WAL mode.
+
+    A login is a primary-key lookup and a signup is a single-row insert.
+    IDs come from ``AUTOINCREMENT``, so concurrent requests and separate
+    worker processes never hand out the same one, and the ID of a removed
+    user is never given to someone else.
+    """
+
+    def __init__(self, path=USER_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connect()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(USERS_TABLE.format(name="IF NOT EXISTS users"))
+            self._upgrade(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _upgrade(conn):
+        # Stores created before AUTOINCREMENT reused the highest ID once it was removed
+        def outdated():
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'users'").fetchone()[0]
+            return "AUTOINCREMENT" not in sql.upper()
+
+        if not outdated():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if outdated():  # another worker may have upgraded it meanwhile
+                conn.execute("DROP INDEX IF EXISTS users_username")
+                conn.execute("ALTER TABLE users RENAME TO users_old")
+                conn.execute(USERS_TABLE.format(name="users"))
+                conn.execute("INSERT INTO users SELECT * FROM users_old")
+                conn.execute("DROP TABLE users_old")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _row(row):
+        return dict(row) if row is not None else None
+
+    def get(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        return self._row(self._connect().execute("SELECT * FROM users WHERE ID = ?", (user_id,)).fetchone())
+
+    def add(self, user):
+        values = [user.get(field) for field in FIELDS if field != "ID"]
+        cursor = self._connect().execute(
+            "INSERT INTO users (Username, Age, Password, Conditions, Gender, Weight, Height) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+        return cursor.lastrowid
+
+    def insert_many(self, users, only_if_empty=False):
+        """Bulk insert users that already carry an ``ID`` (used by the migrator)
+        in one transaction; returns how many were inserted.
+
+        An ``ID`` that is already taken raises ``sqlite3.IntegrityError`` and
+        nothing is inserted. With ``only_if_empty``, nothing is inserted either
+        when the table already has users.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if only_if_empty and conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                conn.execute("ROLLBACK")
+                return 0
+            conn.executemany("INSERT INTO users (Username, ID, Age, Password, Conditions, Gender, Weight, Height) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [[u.get(f) for f in FIELDS] for u in users])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(users)
+
+    def remove(self, user_id):
+        self._connect().execute("DELETE FROM users WHERE ID = ?", (int(user_id),))
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+class CsvUserRepository(UserRepository):
+    """The original whole-file CSV store, kept for single-process setups."""
+
+    def __init__(self, path=user_data_path):
+        import pandas as pd
+        self.path = path
+        self._pd = pd
+        self._df = pd.read_csv(path)
+        self._df.index = self._df["ID"]
+        self._next_id = int(self._df["ID"].max()) + 1 if len(self._df) else 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        if user_id not in self._df.index:
+            return None
+        return self._df.loc[user_id].to_dict()
+
+    def add(self, user):
+        with self._lock:
+            user_id = self._next_id
+            self._next_id += 1
+            row = dict(user, ID=user_id)
+            self._df = self._pd.concat([self._df, self._pd.DataFrame([row], index=[user_id])])
+            self._df.to_csv(self.path, index=False)
+        return user_id
+
+    def remove(self, user_id):
+        with self._lock:
+            self._df = self._df.drop(index=int(user_id), errors="ignore")
+            self._df.to_csv(self.path, index=False)
+
+    def __len__(self):
+        return len(self._df)
+
+
+def migrate_csv(csv_path=user_data_path, db_path=USER_DB_PATH, only_if_empty=False):
+    """Copy every user from the legacy CSV into the SQLite store; returns the count
+    (0 if ``only_if_empty`` and the store already has users)."""
+    import csv
+    with open(csv_path, newline="") as f:
+        users = list(csv.DictReader(f))
+    for user in users:
+        user["ID"] = int(user["ID"])
+        user["Age"] = int(float(user["Age"]))
+        user["Weight"] = float(user["Weight"])
+        user["Height"] = float(user["Height"])
+    return SQLiteUserRepository(db_path).insert_many(users, only_if_empty=only_if_empty)
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository():
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                if USER_STORE == "csv":
+                    _repository = CsvUserRepository()
+                else:
+                    repository = SQLiteUserRepository()
+                    # Every worker tries before it serves, so no signup can take an ID first;
+                    # a failed attempt rolls back completely and the next start retries
+                    if not len(repository) and os.path.exists(user_data_path):
+                        migrate_csv(only_if_empty=True)
+                    _repository = repository
+    return _repository
+
+
+if __name__ == "__main__":
+    # python user_store.py migrate [users.csv] [users.sqlite3]
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        print("usage: python user_store.py migrate [CSV_PATH] [DB_PATH]", file=sys.stderr)
+        sys.exit(2)
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else user_data_path
+    db_path = sys.argv[3] if len(sys.argv) > 3 else USER_DB_PATH
+    print(f"Migrated {migrate_csv(csv_path, db_path)} users from {csv_path} to {db_path}")
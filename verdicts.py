@@ -0,0 +1,103 @@
+import numpy as np
+
+BAD = -1
+NEUTRAL = 0
+GOOD = 1
+VERDICT_CODES = {"bad": BAD, "neutral": NEUTRAL, "good": GOOD}
+
+WARNING_MESSAGE = "Warning: This food contains ingredients that may not be suitable for your health conditions. Please consult a health professional before consuming. \nHarmful ingredients are:"
+SAFE_MESSAGE = "This food looks safe and beneficial based on your selected health conditions."
+NEUTRAL_MESSAGE = "This food is mostly safe, but contains some neutral ingredients. You may consume it in moderation."
+
+
+class VerdictTable:
+    """The ingredient/condition table compiled to an int8 matrix.
+
+    Rows are ingredients, columns are health conditions, cells are BAD,
+    NEUTRAL or GOOD. Lookups follow the labels used by the original
+    ``fic.loc[ingredient.capitalize(), condition.title()]`` check.
+    """
+
+    def __init__(self, fic):
+        condition_columns = [c for c in fic.columns if self._is_verdict_column(fic[c])]
+        table = fic.loc[~fic.index.duplicated(keep="first"), condition_columns]
+
+        self.ingredients = [str(label) for label in table.index]
+        self.conditions = [str(label) for label in condition_columns]
+        self.rows = {label: i for i, label in enumerate(self.ingredients)}
+        self.columns = {label: j for j, label in enumerate(self.conditions)}
+
+        lowered = table.apply(lambda col: col.str.lower())
+        self.matrix = np.zeros(lowered.shape, dtype=np.int8)
+        for word, code in VERDICT_CODES.items():
+            self.matrix[(lowered == word).to_numpy()] = code
+
+    @staticmethod
+    def _is_verdict_column(col):
+        values = col.dropna()
+        return len(values) > 0 and values.astype(str).str.lower().isin(VERDICT_CODES).all()
+
+    def condition_mask(self, conditions):
+        mask = np.zeros(len(self.conditions), dtype=bool)
+        for condition in conditions:
+            j = self.columns.get(str(condition).title())
+            if j is not None:
+                mask[j] = True
+        return mask
+
+    def row_indexes(self, matched):
+        names = [str(name).capitalize() for name in matched]
+        rows = [self.rows[name] for name in names if name in self.rows]
+        return np.array(rows, dtype=np.intp)
+
+    def evaluate(self, mask, matched):
+        """Return ``(has_bad, has_good, bad_ingredients)`` for one condition mask."""
+        rows = self.row_indexes(matched)
+        cols = np.flatnonzero(mask)
+        if not len(rows) or not len(cols):
+            return False, False, []
+
+        cells = self.matrix[np.ix_(rows, cols)]
+        is_bad = cells == BAD
+        has_good = bool((cells == GOOD).any())
+        # one entry per bad (condition, ingredient) pair, in table column order
+        bad_cols, bad_rows = np.nonzero(is_bad.T)
+        bad_ingredients = [self.ingredients[rows[r]] for r in bad_rows]
+        return bool(is_bad.any()), has_good, bad_ingredients
+
+    def condition_masks(self, condition_sets):
+        """Stack one mask per condition set into a (users x conditions) array."""
+        masks = np.zeros((len(condition_sets), len(self.conditions)), dtype=bool)
+        for i, conditions in enumerate(condition_sets):
+            masks[i] = self.condition_mask(conditions)
+        return masks
+
+    def evaluate_many(self, masks, matched):
+        """Vectorised ``evaluate`` of one ingredient list for many masks.
+
+        Returns ``(has_bad, has_good, bad, names)``: one bool per mask for
+        each of the first two, a (masks x rows) bool array marking the rows
+        that are bad for each mask, and the names of those rows.
+        """
+        rows = self.row_indexes(matched)
+        names = [self.ingredients[r] for r in rows]
+        cells = self.matrix[rows]
+        weights = masks.astype(np.int32).T
+        bad = ((cells == BAD).astype(np.int32) @ weights).T > 0
+        good = ((cells == GOOD).astype(np.int32) @ weights).T > 0
+        return bad.any(axis=1), good.any(axis=1), bad, names
+
+    def check(self, mask, matched):
+        """Same ``(message, bad_ingredients)`` pair ``Person.checkeffect`` returns."""
+        has_bad, has_good, bad_ingredients = self.evaluate(mask, matched)
+        return describe(has_bad, has_good, bad_ingredients), bad_ingredients
+
+
+def describe(has_bad, has_good, bad_ingredients):
+    if has_bad:
+        bad_list_str = "\n- " + "\n- ".join(dict.fromkeys(bad_ingredients))
+        return WARNING_MESSAGE + bad_list_str
+    elif has_good:
+        return SAFE_MESSAGE
+    else:
+        return NEUTRAL_MESSAGE